@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+# bench/web_build.py
+# copyright 2017 ViKomprenas, 2-clause BSD license (LICENSE.md)
+
+# Times building webs out of synthetic reference lists of a few sizes, to
+# check that it scales linearly with the number of tracks. Run it from the
+# top of the repo: python3 bench/web_build.py [sizes...]
+
+import argparse
+import os
+import pickle
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import nsndswap.util
+import nsndswap.web
+
+SIZES = [10_000, 100_000, 1_000_000]
+REFERENCES = 3  # average references per track
+UNKNOWN_RATIO = 0.25  # fraction of references to songs without a reference list of their own
+
+
+def make_tracks(count, seed=0, prefix='Song'):
+    # tracks titled "{prefix} N", referencing "Song N"s and "Unknown N"s
+    rng = random.Random(seed)
+    tracks = []
+    for i in range(count):
+        references = []
+        for _ in range(rng.randint(0, REFERENCES * 2)):
+            if rng.random() < UNKNOWN_RATIO:
+                references.append(f'Unknown {rng.randrange(count)}')
+            else:
+                references.append(f'Song {rng.randrange(count)}')
+        tracks.append(nsndswap.util.Track(f'{prefix} {i}', references))
+    return tracks
+
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - start
+
+
+def bench(count):
+    tracks = make_tracks(count)
+    # a second, smaller source referencing the same songs, like the other
+    # reference pages being added into everything
+    remixes = make_tracks(count // 2, seed=1, prefix='Remix')
+    references = sum(len(track.references) for track in tracks)
+
+    def build():
+        web = nsndswap.web.Web()
+        web.append(tracks)
+        return web
+    web, append_time = timed(build)
+
+    def merge():
+        everything = nsndswap.web.Web()
+        everything.merge(web)
+        everything.append(remixes)
+        return everything
+    everything, merge_time = timed(merge)
+
+    pickled = pickle.dumps(web)
+    _, unpickle_time = timed(lambda: pickle.loads(pickled))
+
+    print(f'{count:>9} tracks {references:>9} refs {len(everything.nodes):>9} nodes | '
+          f'append {append_time:7.2f}s ({append_time / count * 1e6:5.2f}us/track) | '
+          f'everything {merge_time:7.2f}s | unpickle {unpickle_time:7.2f}s')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Time building synthetic webs.')
+    parser.add_argument('sizes', nargs='*', type=int, default=SIZES, help='numbers of tracks to try')
+    args = parser.parse_args()
+    for count in args.sizes:
+        bench(count)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,5 +1,11 @@
 import java.io.File;
 import java.lang.String;
+import java.util.ArrayList;
+import java.util.List;
+import java.util.concurrent.ExecutionException;
+import java.util.concurrent.ExecutorService;
+import java.util.concurrent.Executors;
+import java.util.concurrent.Future;
 
 import org.gephi.graph.api.GraphController;
 import org.gephi.graph.api.GraphModel;
@@ -18,54 +24,122 @@ import org.gephi.project.api.ProjectController;
 import org.gephi.project.api.Workspace;
 import org.openide.util.Lookup;
 
+// Lays out every gexf file given on the command line, in place. All of them
+// share one JVM and one Gephi project, each file getting a workspace of its
+// own, and a pool of one thread per core works through them.
 public class GephiBridge {
     private static final float AREA_FACTOR = 1.461560947f; // area per node
 
+    private static ProjectController pc;
+    private static ImportController ic;
+    private static GraphController gc;
+    private static ExportController ec;
+
     public static void main(String[] args) throws Exception {
-        ProjectController pc = Lookup.getDefault().lookup(ProjectController.class);
+        if (args.length == 0) {
+            System.err.println("usage: java GephiBridge FILE.gexf...");
+            System.exit(2);
+        }
+        long start = System.nanoTime();
+        pc = Lookup.getDefault().lookup(ProjectController.class);
+        ic = Lookup.getDefault().lookup(ImportController.class);
+        gc = Lookup.getDefault().lookup(GraphController.class);
+        ec = Lookup.getDefault().lookup(ExportController.class);
         pc.newProject();
-        Workspace workspace = pc.getCurrentWorkspace();
+        System.out.println("Started Gephi in " + seconds(start));
 
-        ImportController ic = Lookup.getDefault().lookup(ImportController.class);
-        Container container = ic.importFile(new File(args[0]));
-        container.verify();
-        ic.process(container, new DefaultProcessor(), workspace);
+        int threads = Math.min(args.length, Runtime.getRuntime().availableProcessors());
+        ExecutorService executor = Executors.newFixedThreadPool(threads);
+        List<Future<?>> futures = new ArrayList<>();
+        for (String path : args) {
+            futures.add(executor.submit(() -> {
+                layOut(path);
+                return null;
+            }));
+        }
+        executor.shutdown();
 
-        GraphController gc = Lookup.getDefault().lookup(GraphController.class);
-        GraphModel gm = gc.getGraphModel();
+        int failures = 0;
+        for (int i = 0; i < args.length; i++) {
+            try {
+                futures.get(i).get();
+            } catch (ExecutionException e) {
+                System.err.println("Failed to lay out " + args[i] + ": " + e.getCause());
+                e.getCause().printStackTrace();
+                failures++;
+            }
+        }
+        System.out.println("Laid out " + String.valueOf(args.length - failures) + " of "
+                + String.valueOf(args.length) + " files with " + String.valueOf(threads)
+                + " threads in " + seconds(start));
+        System.exit(failures == 0 ? 0 : 1);
+    }
+
+    private static void layOut(String path) throws Exception {
+        long start = System.nanoTime();
+        File file = new File(path);
+        // The project, and the import and export controllers working on it,
+        // are shared by every thread, so importing and exporting happen one
+        // file at a time under the project's lock. The layouts in between
+        // only touch this file's own workspace, so they run in parallel.
+        Workspace workspace;
+        GraphModel gm;
+        synchronized (pc) {
+            workspace = pc.newWorkspace(pc.getCurrentProject());
+            Container container = ic.importFile(file);
+            container.verify();
+            ic.process(container, new DefaultProcessor(), workspace);
+            gm = gc.getGraphModel(workspace);
+        }
+        System.out.println("Imported " + path + " in " + seconds(start));
+
+        long stage = System.nanoTime();
         FruchtermanReingold fr = new FruchtermanReingoldBuilder().buildLayout();
         fr.setGraphModel(gm);
         fr.initAlgo();
         fr.resetPropertiesValues();
-        fr.setArea(GephiBridge.AREA_FACTOR * gc.getGraphModel().getGraph().getNodeCount());
+        fr.setArea(GephiBridge.AREA_FACTOR * gm.getGraph().getNodeCount());
         fr.setSpeed(2d);
-        for (int i = 0; i < 2000 && fr.canAlgo(); i++) {
-            System.out.println("Running FR iteration number " + String.valueOf(i) + " on " + args[0]);
+        int i;
+        for (i = 0; i < 2000 && fr.canAlgo(); i++) {
             fr.goAlgo();
         }
         fr.endAlgo();
+        System.out.println("Ran " + String.valueOf(i) + " FR iterations on " + path + " in " + seconds(stage));
+
+        stage = System.nanoTime();
         NoverlapLayout no = (NoverlapLayout) new NoverlapLayoutBuilder().buildLayout();
         no.setGraphModel(gm);
         no.initAlgo();
         no.resetPropertiesValues();
-        for (int i = 0; i < 50 && no.canAlgo(); i++) {
-            System.out.println("Running NO iteration number " + String.valueOf(i) + " on " + args[0]);
+        for (i = 0; i < 50 && no.canAlgo(); i++) {
             no.goAlgo();
         }
         no.endAlgo();
+        System.out.println("Ran " + String.valueOf(i) + " NO iterations on " + path + " in " + seconds(stage));
+
+        stage = System.nanoTime();
         LabelAdjust la = new LabelAdjustBuilder().buildLayout();
         la.setGraphModel(gm);
         la.initAlgo();
         la.resetPropertiesValues();
-        for (int i = 0; i < 50 && la.canAlgo(); i++) {
-            System.out.println("Running LA iteration number " + String.valueOf(i) + " on " + args[0]);
+        for (i = 0; i < 50 && la.canAlgo(); i++) {
             la.goAlgo();
         }
         la.endAlgo();
+        System.out.println("Ran " + String.valueOf(i) + " LA iterations on " + path + " in " + seconds(stage));
+
+        synchronized (pc) {
+            // a new exporter each time, since it remembers its workspace
+            GraphExporter gexfExporter = (GraphExporter) ec.getExporter("gexf");
+            gexfExporter.setWorkspace(workspace);
+            ec.exportFile(file, gexfExporter);
+            pc.deleteWorkspace(workspace);
+        }
+        System.out.println("Laid out " + path + " in " + seconds(start));
+    }
 
-        ExportController ec = Lookup.getDefault().lookup(ExportController.class);
-        GraphExporter gexfExporter = (GraphExporter) ec.getExporter("gexf");
-        gexfExporter.setWorkspace(workspace);
-        ec.exportFile(new File(args[0]), gexfExporter);
+    private static String seconds(long since) {
+        return String.format("%.2fs", (System.nanoTime() - since) / 1e9);
     }
 }
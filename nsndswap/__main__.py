@@ -2,64 +2,175 @@
 # nsndswap/__main__.py
 # copyright 2017 ViKomprenas, 2-clause BSD license (LICENSE.md)
 
-import sys
-import requests
+import argparse
+import concurrent.futures
+import functools
+import inspect
+import logging
+import os
+import re
 import nsndswap.util
+import nsndswap.disambiguate
 import nsndswap.makin_nsnd
 import nsndswap.cookie_nsnd
 import nsndswap.viko_nsnd
 import nsndswap.web
+import nsndswap.dump
+import nsndswap.layout
+import nsndswap.fetch
+import nsndswap.pagecache
+
+log = logging.getLogger(__name__)
+
+MAKIN_URL = 'https://homestuck.net/music/references.html'
+COOKIE_URL = 'https://wheals.github.io/canwc/nsnd.html'
+LOG_LEVELS = [logging.WARNING, logging.INFO, logging.DEBUG]
 
 
 def main():
-    makin_nsnd = get_nsnd_page('https://homestuck.net/music/references.html')
-    makin_nsnd = nsndswap.makin_nsnd.parse(makin_nsnd)
-    makin_nsnd = postprocess(makin_nsnd)
-    cookie_nsnd = get_nsnd_page('https://wheals.github.io/canwc/nsnd.html')
-    cookie_nsnd = nsndswap.cookie_nsnd.parse(cookie_nsnd)
-    cookie_nsnd = postprocess(cookie_nsnd)
+    parser = argparse.ArgumentParser(prog='nsndswap')
+    parser.add_argument('--gzip', action='store_true', help='write the .gexf files gzipped, as .gexf.gz')
+    parser.add_argument('--cache-dir', default='cache', help='where to keep downloaded pages (default: %(default)s)')
+    parser.add_argument('--offline', action='store_true', help='use only the cached pages, never the network')
+    parser.add_argument('--layout', nargs='?', type=int, const=nsndswap.layout.FR_ITERATIONS, default=0,
+                        metavar='ITERATIONS', help='lay out the .gexf files, with %(const)s iterations '
+                        'unless told otherwise')
+    parser.add_argument('--layout-theta', type=float, default=nsndswap.layout.FR_THETA, metavar='THETA',
+                        help='how coarsely the layout approximates far-off nodes; 0 is exact but slow on big webs '
+                        '(default: %(default)s)')
+    parser.add_argument('--warm-start', metavar='DIR',
+                        help='with --layout, start from the layouts in an earlier run\'s output directory, '
+                        'and only refine them')
+    parser.add_argument('--size-by', choices=nsndswap.web.SIZE_METRICS, default='degree',
+                        help='what the node sizes in the .gexf files show (default: %(default)s)')
+    parser.add_argument('--legacy-placement', action='store_true',
+                        help='start the nodes in the .gexf files where the original version put them, '
+                        'with the same colours')
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                        help='how many processes write the output files (default: one per CPU)')
+    parser.add_argument('-v', '--verbose', action='count', default=0,
+                        help='log progress; give it twice to log every song and reference too')
+    args = parser.parse_args()
+    configure_logging(args.verbose)
+    check_title_table(postprocess_title_table, intended_title_loops)
+
+    # both pages download in the background, each one parsed while it arrives
+    nsnds = load_nsnd_pages({MAKIN_URL: nsndswap.makin_nsnd, COOKIE_URL: nsndswap.cookie_nsnd},
+                            cache=nsndswap.pagecache.PageCache(args.cache_dir),
+                            parse_cache=nsndswap.pagecache.ParseCache(os.path.join(args.cache_dir, 'parsed')),
+                            offline=args.offline)
+    makin_nsnd = nsnds[MAKIN_URL].result()
+    cookie_nsnd = nsnds[COOKIE_URL].result()
     viko_nsnd = nsndswap.viko_nsnd.parse()
     viko_nsnd = postprocess(viko_nsnd)
 
-    print('Building makin_web')
+    log.info('Building makin_web')
     makin_web = nsndswap.web.Web()
     makin_web.append(makin_nsnd, skip_on_duplicate=['Requiem for Something Really Excellent (Demo)', 'Skaian Shuffle', 'Mother (Malcolm Brown)', 'Skaia Voyages', 'Clockwork Apocalypse', 'Double Midnight', 'Hawkeye', 'Homosuck Anthem', 'Jadesprite', 'Penumbra Phantasm', 'Mother (Malcolm Brown)', "Egbert's Kitchen"])
-    dump(makin_web, 'homestuck')
 
-    print('Building cookie_web')
+    log.info('Building cookie_web')
     cookie_web = nsndswap.web.Web()
     cookie_web.append([nsndswap.util.Track('Showtime (Imp Strife Mix)', ['Showtime'])])
     cookie_web.append(cookie_nsnd, override_on_duplicate=['C R Y S T A L S'], skip_on_duplicate=['Showtime (Imp Strife Mix)'])
-    dump(cookie_web, 'canwc')
 
-    print('Building viko_web')
+    log.info('Building viko_web')
     viko_web = nsndswap.web.Web()
     viko_web.append(viko_nsnd)
-    dump(viko_web, 'viko')
 
-    print('Building all_web')
+    log.info('Building all_web')
     all_web = nsndswap.web.Web()
-    all_web.append(makin_nsnd, skip_on_duplicate=['Requiem for Something Really Excellent (Demo)', 'Skaian Shuffle', 'Mother (Malcolm Brown)', 'Skaia Voyages', 'Clockwork Apocalypse', 'Double Midnight', 'Hawkeye', 'Homosuck Anthem', 'Jadesprite', 'Penumbra Phantasm', 'Mother (Malcolm Brown)', "Egbert's Kitchen"])
+    all_web.merge(makin_web)
+    # cookie_web overrode a song while it was built (and has an extra one up front), so it can't be merged
     all_web.append(cookie_nsnd, override_on_duplicate=['C R Y S T A L S', 'Tick', 'Rex Mille Geromius', 'Smackdown', 'Contra', 'CONTACT', 'Moshi Moshi?', 'Unintentional Touhou', 'Muse of Nanchos', 'Intro', 'daet with roze', 'Lord Spanish', 'Something Familiar', 'Stay in Touch', 'Midnight Suffer', 'The Gemoni Mustard Blood', 'Formation', 'hors', 'Jungle #3', 'Revisit/Rewind', 'Resend', 'Aura of Colour', 'Ringleader', 'Collision Course (Davepeta\'s Movement)', 'Horizontal Headshot', 'Raise of the Conductor\'s Baton'], skip_on_duplicate=['Showtime (Imp Strife Mix)', 'A History of Babies', 'Throguh Song', 'The Baby is You', 'bootes', 'rose pragnant', 'the rose rap', 'uh oh', 'vs bros', 'a baby is born', 'Old Secret', 'Conflict!', 'Apexhalation'])
-    all_web.append(viko_nsnd, override_on_duplicate=['Cascadium Dioxide', 'Conflict!', 'Malediction', 'Taureg', 'Your Best Friend', 'Metal Crusher', 'CORE', 'Death by Glamour', 'Menu (Full)', 'Hopes and Dreams', 'Spider Dance', 'Reunited', 'Snowdin Town', 'Spooktune', 'Dogsong'])
-    dump(all_web, 'everything')
-
-
-def get_nsnd_page(url):
-    print(f'Fetching {url}')
-    try:
-        req = requests.get(url)
-        if req.status_code != 200:
-            sys.stderr.write(f'Request for nsnd returned {req.status_code}, aborting\n')
-            raise SystemExit(1)
-        nsndtext = req.text
-        if len(nsndtext) == 0:
-            sys.stderr.write(f'Got a blank page instead of nsnd, aborting\n')
-            raise SystemExit(1)
-        return nsndtext.strip().replace('\n', '')
-    except Exception as e:
-        sys.stderr.write(f'Caught an exception while fetching nsnd\n')
-        raise
+    all_web.merge(viko_web, override_on_duplicate=['Cascadium Dioxide', 'Conflict!', 'Malediction', 'Taureg', 'Your Best Friend', 'Metal Crusher', 'CORE', 'Death by Glamour', 'Menu (Full)', 'Hopes and Dreams', 'Spider Dance', 'Reunited', 'Snowdin Town', 'Spooktune', 'Dogsong'])
+
+    nsndswap.dump.dump_webs({'homestuck': makin_web, 'canwc': cookie_web, 'viko': viko_web, 'everything': all_web},
+                            workers=args.jobs, gzip_gexf=args.gzip,
+                            layout_iterations=args.layout, layout_theta=args.layout_theta,
+                            warm_start=args.warm_start, size_by=args.size_by,
+                            legacy_placement=args.legacy_placement)
+
+
+def configure_logging(verbosity):
+    # records below the level are dropped before they're formatted
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter(nsndswap.util.LOG_FORMAT))
+    root = logging.getLogger()
+    root.addHandler(handler)
+    root.setLevel(LOG_LEVELS[min(verbosity, len(LOG_LEVELS) - 1)])
+
+
+def load_nsnd_pages(sources, *, cache=None, parse_cache=None, offline=False):
+    # sources is {url: parser module}; returns {url: future of load_nsnd_page}, all running concurrently
+    session = nsndswap.fetch.make_session()
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=len(sources))
+    nsnds = {url: executor.submit(load_nsnd_page, url, parser_module, session, cache=cache,
+                                  parse_cache=parse_cache, offline=offline)
+             for url, parser_module in sources.items()}
+    # no more jobs are coming, but don't wait for these ones to finish
+    executor.shutdown(wait=False)
+    return nsnds
+
+
+def load_nsnd_page(url, parser_module, session=None, *, cache=None, parse_cache=None, offline=False):
+    # Fetches a page and parses it as it arrives, then postprocesses it. If the
+    # page came from the cache, the parse cache may let all of that be skipped.
+    page = nsndswap.fetch.open_nsnd_page(url, session, cache=cache, offline=offline)
+    name = parser_module.__name__.rpartition('.')[2]
+    if parse_cache is not None and page.sha256 is not None:
+        nsnd = parse_cache.load(name, parse_key(page.sha256, parser_module))
+        if nsnd is not None:
+            log.info('Using the cached parse of %s', name)
+            return nsnd
+    nsnd = postprocess(parser_module.parse_stream(page))
+    if parse_cache is not None:
+        parse_cache.store(name, parse_key(page.sha256, parser_module), nsnd)
+    return nsnd
+
+
+def parse_key(page_sha256, parser_module):
+    return nsndswap.pagecache.ParseCache.key(
+        page_sha256, inspect.getsource(parser_module), inspect.getsource(nsndswap.disambiguate),
+        inspect.getsource(nsndswap.util), normalization_fingerprint())
+
+
+def normalization_fingerprint():
+    # everything postprocess depends on, so the parse cache notices when any of it changes
+    return repr((inspect.getsource(postprocess), inspect.getsource(normalize_title),
+                 inspect.getsource(postprocess_title), _EXPANSIONS, _ALBUM_NAMES,
+                 postprocess_title_table, sorted(forbidden_names), special_cases))
+
+
+def check_title_table(table, intended_loops=()):
+    # Titles only go through the table once, so a title that maps to another
+    # key gets a different result from that key, and a loop of them swaps the
+    # titles around. Both are easy to make by accident, so anything but the
+    # intended loops (each given as the set of its titles) stops the run.
+    intended_loops = [frozenset(loop) for loop in intended_loops]
+    in_loops = set()
+    bad = False
+    for start in table:
+        path = []
+        title = start
+        while title in table and title not in path and title not in in_loops:
+            path.append(title)
+            title = table[title]
+        if title in path:
+            loop = path[path.index(title):]
+            in_loops.update(loop)
+            if len(loop) == 1 or frozenset(loop) in intended_loops:
+                continue  # mapped to itself, which does nothing, or meant to be there
+            log.error('postprocess_title_table maps titles round in a loop: %s',
+                      ' -> '.join(f'"{x}"' for x in loop + [title]))
+            bad = True
+    for title, new_title in table.items():
+        if new_title in table and title not in in_loops:
+            log.error('postprocess_title_table maps "%s" to "%s", which it maps to "%s" in turn',
+                      title, new_title, table[new_title])
+            bad = True
+    if bad:
+        log.error('Fix postprocess_title_table, or add the loop to intended_title_loops, aborting')
+        raise SystemExit(2)
 
 
 def postprocess(nsnd):
@@ -156,14 +267,19 @@ postprocess_title_table = {
     "~~Disk 4~~": "Disc 4 (Stable Time Loops and Paradoxes)",
 }
 
-forbidden_names = [
+# loops in postprocess_title_table that are there on purpose, as the set of titles in each
+intended_title_loops = [
+    {"Love You", "Love You (Feferi's Theme)"},
+]
+
+forbidden_names = {
     # Things that need manual disambiguation
     'Light', 'Frost', '~~SIDE 1~~', '~~SIDE 2~~', '~~ADDITIONAL MAYHEM~~', 'Game Over', 'Under the Hat', 'Red Miles', '==>', 'Checkmate', 'Premonition', 'Moondoctor', '==>', 'Checkmate', 'Anticipation', 'Three in the Morning (4 1/3 Hours Late Remix)', 'Fake Fruit Fiesta', 'Showup', 'Stress', 'Contention', 'Mother', 'Fanfare', "Don't Hug Me I'm Scared", 'Let It Snow', "I Don't Want to Miss a Thing", 'Sunrise', 'Mutiny', 'Swan Song', 'Downwards', 'Midnight', 'Meme Voyage', 'Vegetal Colina', 'Enter with Caliborn: Destruction Adventure', '"Libera me" from Bowman', 'Fighting Spirit ~Double Ascended Form~', '1 Through 15', '72.0x SHOWDOWN COMBO', 'Welcome to Flavortown (Battle Against a Bodacious Foe)', 'Welcome to Flavortown', 'you have got to be SHITTONG me (temp title)', 'you have got to be SHITTONG me', 'The End of Something Really Excellent', 'Strife Mayhem', 'Null', 'Aggress', 'Meldey', 'Explored', 'Rain', 'Sunset', 'Daydreamer', 'Home', 'Cornered'
     # Artist names (might be caught by cookie_nsnd if things aren't doing well)
     'HadronKalido', 'Hadron Kalido', 'ostrichlittledungeon', 'Sir Felix (Jaspy)', 'ost', 'cookiefonster', 'Makin', 'wheals', 'Difarem',
     # Typos
     'Horscatska',
-]
+}
 
 special_cases = {
     # (title, reference): new_reference
@@ -250,49 +366,57 @@ special_cases = {
 }
 
 
+# special_cases, looked up by context first
+special_cases_by_context = {}
+for (_context, _title), _new_title in special_cases.items():
+    special_cases_by_context.setdefault(_context, {})[_title] = _new_title
+del _context, _title, _new_title
+
+# The substitutions are done in the same stages as the chain of str.replace
+# calls they replace, since some of them (dropping newlines, say) can make
+# matches for the later ones.
+_ZWSP_TABLE = str.maketrans({'\u200b': ' '})
+_EXPANSIONS = {
+    'ICBSITC': 'I Can Barely Sleep In This Casino',
+    'IaMotMC': "I'm a Member of the Midnight Crew",
+    ' (unreleased)': '',
+    ' (??)': '',
+}
+_PUNCTUATION_TABLE = str.maketrans({'\n': None, '’': "'", '…': '...'})
+_ALBUM_NAMES = {
+    'vol. s*x': 'cool and new volume s*x: hair transplant',
+    'CANH2': 'Cool and New Homestuck 2',
+    'vol. 8': 'V8lume',
+    '(locomotif)': '(call and new 2: locomotif)',  # replacement string includes original so we have to avoid hitting already-correct titles if there are any
+}
+
+
+def _substitution_pattern(table):
+    return re.compile('|'.join(re.escape(key) for key in table))
+
+
+_EXPANSIONS_PATTERN = _substitution_pattern(_EXPANSIONS)
+_ALBUM_NAMES_PATTERN = _substitution_pattern(_ALBUM_NAMES)
+
+
+@functools.lru_cache(maxsize=1 << 14)
+def normalize_title(title):
+    # everything postprocess_title does that doesn't depend on the context
+    title = title.translate(_ZWSP_TABLE)
+    title = _EXPANSIONS_PATTERN.sub(lambda match: _EXPANSIONS[match.group()], title)
+    title = title.translate(_PUNCTUATION_TABLE).replace('  ', ' ')
+    title = _ALBUM_NAMES_PATTERN.sub(lambda match: _ALBUM_NAMES[match.group()], title).strip()
+    return postprocess_title_table.get(title, title)
+
+
 def postprocess_title(title, context):
-    title = (title.replace('\u200b', ' ')
-                  .replace('ICBSITC', 'I Can Barely Sleep In This Casino')
-                  .replace('IaMotMC', "I'm a Member of the Midnight Crew")
-                  .replace(' (unreleased)', '')
-                  .replace(' (??)', '')
-                  .replace('\n', '')
-                  .replace('  ', ' ')
-                  .replace('’', "'")
-                  .replace('…', '...')
-                  .replace('vol. s*x', 'cool and new volume s*x: hair transplant')
-                  .replace('CANH2', 'Cool and New Homestuck 2')
-                  .replace('vol. 8', 'V8lume')
-                  .replace('(locomotif)', '(call and new 2: locomotif)')  # replacement string includes original so we have to avoid hitting already-correct titles if there are any
-                  .strip())
-    if title in postprocess_title_table.keys():
-        title = postprocess_title_table[title]
-    if (context, title) in special_cases.keys():
-        title = special_cases[(context, title)]
+    title = normalize_title(title)
+    title = special_cases_by_context.get(context, {}).get(title, title)
     if title in forbidden_names:
-        print(f'Got a forbidden name "{title}", aborting (context: "{context}")')
+        log.error('Got a forbidden name "%s", aborting (context: "%s")', title, context)
         raise Exception()
     return title
 
 
-def dump(web, name):
-    with open(f'output/{name}.gexf', 'w') as f:
-        web.dump_gexf(f)
-    with open(f'output/{name}.reverse.gexf', 'w') as f:
-        web.dump_gexf(f, reverse_size=True)
-    with open(f'output/{name}.titles.txt', 'w') as f:
-        web.dump_titles(f)
-    with open(f'output/{name}.txt', 'w') as f:
-        web.dump_plaintext(f)
-    with open(f'output/{name}.reverse.txt', 'w') as f:
-        web.dump_plaintext(f, reverse=True)
-    with open(f'output/{name}.unknown.txt', 'w') as f:
-        web.dump_unknown_references(f)
-    with open(f'output/{name}.unicode.txt', 'w') as f:
-        web.dump_unicode_titles(f)
-    with open(f'output/{name}.pkl', 'wb') as f:
-        web.dump_pickle(f)
-
-
 if __name__ == '__main__':
     main()
@@ -0,0 +1,307 @@
+#!/usr/bin/env python3
+# nsndswap/analytics.py
+# copyright 2017 ViKomprenas, 2-clause BSD license (LICENSE.md)
+
+# Scores for how much each song matters, worked out over the web in
+# compressed-sparse-row form: indptr[i]:indptr[i + 1] is the slice of indices
+# holding node i's references. Edges point from a song to what it references,
+# so scores that flow along them collect on the songs that get referenced.
+
+import numpy
+
+PAGERANK_DAMPING = 0.85
+PAGERANK_TOLERANCE = 1e-10  # stop once the ranks move less than this in total
+HITS_TOLERANCE = 1e-10
+MAX_ITERATIONS = 1000
+
+_BITSET_CHUNK_BYTES = 1 << 26  # bitset memory to work with at once when counting reachable nodes
+_POPCOUNT = numpy.array([bin(i).count('1') for i in range(256)], dtype=numpy.uint8)
+
+
+def csr(sources, targets, node_count):
+    # (indptr, indices) for the edges, which keep their order within each row
+    order = numpy.argsort(sources, kind='stable')
+    indptr = numpy.zeros(node_count + 1, dtype=numpy.intp)
+    numpy.cumsum(numpy.bincount(sources, minlength=node_count), out=indptr[1:])
+    return indptr, numpy.asarray(targets, dtype=numpy.intp)[order]
+
+
+def transpose(indptr, indices):
+    # the CSR form of the same graph with every edge turned around
+    node_count = len(indptr) - 1
+    return csr(indices, numpy.repeat(numpy.arange(node_count), numpy.diff(indptr)), node_count)
+
+
+def pagerank(indptr, indices, *, damping=PAGERANK_DAMPING, tolerance=PAGERANK_TOLERANCE,
+             max_iterations=MAX_ITERATIONS):
+    # Power iteration, summing to 1. Nodes without references share their
+    # rank out evenly, as if they referenced everything.
+    node_count = len(indptr) - 1
+    if node_count == 0:
+        return numpy.zeros(0)
+    out_deg = numpy.diff(indptr)
+    dangling = out_deg == 0
+    share = numpy.divide(1.0, out_deg, out=numpy.zeros(node_count), where=~dangling)
+    rank = numpy.full(node_count, 1.0 / node_count)
+    for _ in range(max_iterations):
+        flow = numpy.bincount(indices, weights=numpy.repeat(rank * share, out_deg), minlength=node_count)
+        new_rank = damping * flow + (damping * rank[dangling].sum() + 1.0 - damping) / node_count
+        change = numpy.abs(new_rank - rank).sum()
+        rank = new_rank
+        if change < tolerance:
+            break
+    return rank
+
+
+def hits(indptr, indices, *, tolerance=HITS_TOLERANCE, max_iterations=MAX_ITERATIONS):
+    # (hubs, authorities), each scaled to a maximum of 1. A good hub
+    # references good authorities, and a good authority is referenced by good
+    # hubs.
+    node_count = len(indptr) - 1
+    rows = numpy.repeat(numpy.arange(node_count), numpy.diff(indptr))
+    hub = numpy.ones(node_count)
+    authority = numpy.zeros(node_count)
+    for _ in range(max_iterations):
+        authority = _scaled(numpy.bincount(indices, weights=hub[rows], minlength=node_count))
+        new_hub = _scaled(numpy.bincount(rows, weights=authority[indices], minlength=node_count))
+        change = numpy.abs(new_hub - hub).sum()
+        hub = new_hub
+        if change < tolerance:
+            break
+    return hub, authority
+
+
+def _scaled(scores):
+    top = scores.max(initial=0)
+    return scores / top if top > 0 else scores
+
+
+def strongly_connected_components(indptr, indices):
+    # (component of each node, number of components), by Tarjan's algorithm
+    # with an explicit stack. Components are numbered in the order they're
+    # finished, which puts everything a component references before it: for
+    # every edge, the source's component is no smaller than the target's.
+    node_count = len(indptr) - 1
+    indptr = indptr.tolist()
+    indices = indices.tolist()
+    order = [-1] * node_count  # when each node was first reached
+    low = [0] * node_count  # the earliest node on the stack each node can get back to
+    component = [-1] * node_count
+    on_stack = [False] * node_count
+    stack = []
+    reached = 0
+    component_count = 0
+    for root in range(node_count):
+        if order[root] != -1:
+            continue
+        order[root] = low[root] = reached
+        reached += 1
+        stack.append(root)
+        on_stack[root] = True
+        work = [(root, indptr[root])]  # nodes being visited, with the next edge to follow from each
+        while work:
+            node, position = work[-1]
+            end = indptr[node + 1]
+            while position < end:
+                child = indices[position]
+                position += 1
+                if order[child] == -1:
+                    work[-1] = (node, position)
+                    order[child] = low[child] = reached
+                    reached += 1
+                    stack.append(child)
+                    on_stack[child] = True
+                    work.append((child, indptr[child]))
+                    break
+                if on_stack[child] and order[child] < low[node]:
+                    low[node] = order[child]
+            else:
+                work.pop()
+                if low[node] == order[node]:
+                    while True:
+                        member = stack.pop()
+                        on_stack[member] = False
+                        component[member] = component_count
+                        if member == node:
+                            break
+                    component_count += 1
+                if work:
+                    parent = work[-1][0]
+                    if low[node] < low[parent]:
+                        low[parent] = low[node]
+    return numpy.array(component, dtype=numpy.intp), component_count
+
+
+def shortest_cycle(indptr, indices, component, node):
+    # The node ids of a shortest chain of edges from node back to itself, not
+    # repeating node at the end, or None if it isn't in a cycle. Only nodes in
+    # its component can be on one, so nothing else is looked at.
+    parent = {node: None}
+    frontier = [node]
+    while frontier:
+        next_frontier = []
+        for current in frontier:
+            for child in indices[indptr[current]:indptr[current + 1]].tolist():
+                if child == node:
+                    cycle = []
+                    while current is not None:
+                        cycle.append(current)
+                        current = parent[current]
+                    return cycle[::-1]
+                if child not in parent and component[child] == component[node]:
+                    parent[child] = current
+                    next_frontier.append(child)
+        frontier = next_frontier
+    return None
+
+
+def condense(indptr, indices, component, component_count):
+    # (sources, targets) of the edges between components, each one kept once
+    sources = component[numpy.repeat(numpy.arange(len(indptr) - 1), numpy.diff(indptr))]
+    targets = component[indices]
+    between = sources != targets
+    pairs = numpy.unique(sources[between] * component_count + targets[between])
+    return pairs // component_count, pairs % component_count
+
+
+class _Bitsets:
+    # Bitsets of the nodes each component can reach, given the edges between
+    # components, numbered so that every edge's source is above its target.
+    # Every component gets one, made by or-ing together those of the
+    # components it references, except for single nodes that reference
+    # nothing, which are just a bit to set. They're filled in a level at a
+    # time, each level being the components whose longest chain of references
+    # to others with bitsets is that long, so everything a level needs is done
+    # before it. Any range of nodes can be done on its own, to bound the
+    # memory the bitsets need.
+    def __init__(self, component, component_count, sources, targets):
+        self.component = component
+        self.node_count = len(component)
+        self.sizes = numpy.bincount(component, minlength=component_count)
+        self.has_bits = (numpy.bincount(sources, minlength=component_count) > 0) | (self.sizes > 1)
+        self.row = numpy.cumsum(self.has_bits) - 1  # where each component's bitset is, if it has one
+        self.row_count = int(self.has_bits.sum())
+        only_node = numpy.empty(component_count, dtype=numpy.intp)
+        only_node[component] = numpy.arange(self.node_count)  # for the single nodes
+        to_leaf = ~self.has_bits[targets]
+        member_nodes = numpy.flatnonzero(self.has_bits[component])
+        self._bits_to_set = [  # (rows, nodes) of the bits that are set from the start
+            (self.row[component[member_nodes]], member_nodes),
+            (self.row[sources[to_leaf]], only_node[targets[to_leaf]]),
+        ]
+
+        sources = sources[~to_leaf]
+        targets = targets[~to_leaf]
+        height = numpy.zeros(component_count, dtype=numpy.intp)
+        while True:
+            new_height = height.copy()
+            numpy.maximum.at(new_height, sources, height[targets] + 1)
+            if numpy.array_equal(new_height, height):
+                break
+            height = new_height
+        order = numpy.lexsort((sources, height[sources]))
+        sources = sources[order]
+        targets = targets[order]
+        self._levels = []  # (rows to update, where each one's edges start, rows to read), a level at a time
+        level_start = 0
+        for level_end in numpy.searchsorted(height[sources], numpy.arange(1, height.max(initial=0) + 1),
+                                            side='right').tolist():
+            level_sources = sources[level_start:level_end]
+            group_starts = numpy.flatnonzero(numpy.diff(level_sources, prepend=-1))
+            self._levels.append((self.row[level_sources[group_starts]], group_starts,
+                                 self.row[targets[level_start:level_end]]))
+            level_start = level_end
+
+    def fill(self, start=0, count=None):
+        # uint64[row_count, words] of the bits for nodes start to start + count
+        if count is None:
+            count = self.node_count - start
+        bits = numpy.zeros((self.row_count, (count + 63) // 64), dtype=numpy.uint64)
+        for rows, nodes in self._bits_to_set:
+            in_range = (nodes >= start) & (nodes < start + count)
+            offsets = (nodes[in_range] - start).astype(numpy.uint64)
+            numpy.bitwise_or.at(bits, (rows[in_range], offsets >> numpy.uint64(6)),
+                                numpy.uint64(1) << (offsets & numpy.uint64(63)))
+        for level_rows, group_starts, level_targets in self._levels:
+            bits[level_rows] |= numpy.bitwise_or.reduceat(bits[level_targets], group_starts, axis=0)
+        return bits
+
+    def counts(self, bits_per_chunk):
+        # how many other nodes each node can reach, from bitsets filled in
+        # chunks of bits_per_chunk (or from bits_per_chunk itself, if it's
+        # an array fill already returned for every node)
+        counts = numpy.where(self.has_bits, 0, self.sizes)
+        for bits in bits_per_chunk:
+            counts[self.has_bits] += _POPCOUNT[bits.view(numpy.uint8)].sum(axis=1, dtype=numpy.int64)
+        return counts[self.component] - 1
+
+
+def reachable_counts(component, component_count, sources, targets):
+    # how many other nodes each node can reach, given the edges between
+    # components as _Bitsets takes them
+    bitsets = _Bitsets(component, component_count, sources, targets)
+    chunk_nodes = max(64, _BITSET_CHUNK_BYTES // max(1, bitsets.row_count) // 8 * 64)
+    return bitsets.counts(bitsets.fill(start, min(chunk_nodes, len(component) - start))
+                          for start in range(0, len(component), chunk_nodes))
+
+
+def transitive_counts(indptr, indices, components=None):
+    # (references, referenced_by): how many songs each song references
+    # through any chain of references, and how many reference it that way.
+    # components is what strongly_connected_components returns, if it's known.
+    component, component_count = components or strongly_connected_components(indptr, indices)
+    sources, targets = condense(indptr, indices, component, component_count)
+    references = reachable_counts(component, component_count, sources, targets)
+    # turning every edge around means numbering the components the other way
+    flip = component_count - 1 - numpy.arange(component_count)
+    referenced_by = reachable_counts(flip[component], component_count, flip[targets], flip[sources])
+    return references, referenced_by
+
+
+class ReachabilityIndex:
+    # Which nodes each node can reach through any chain of edges, and which
+    # can reach it, as one bitset per component in each direction. Building
+    # it takes about as long as transitive_counts, but needs the bitsets for
+    # every node at once; after that, each question is a lookup or two.
+    def __init__(self, indptr, indices, components=None):
+        component, component_count = components or strongly_connected_components(indptr, indices)
+        sources, targets = condense(indptr, indices, component, component_count)
+        flip = component_count - 1 - numpy.arange(component_count)
+        self.node_count = len(component)
+        self.component = component
+        self.component_count = component_count
+        self._forward = _Bitsets(component, component_count, sources, targets)
+        self._backward = _Bitsets(flip[component], component_count, flip[targets], flip[sources])
+        self._forward_bits = self._forward.fill()
+        self._backward_bits = self._backward.fill()
+        self.reachable_counts = self._forward.counts([self._forward_bits])
+        self.reaching_counts = self._backward.counts([self._backward_bits])
+        # plain ints for the single-node lookups, which numpy is slow at
+        self._forward_rows = numpy.where(self._forward.has_bits, self._forward.row, -1)[component].tolist()
+        self._backward_rows = numpy.where(self._backward.has_bits, self._backward.row, -1)[flip[component]].tolist()
+
+    def reaches(self, source, target):
+        # whether there's a chain of edges from source to target
+        if source == target:
+            # only through a cycle, so there must be others in its component
+            return bool(self._forward.sizes[self.component[source]] > 1)
+        return self._has_bit(self._forward_bits, self._forward_rows[source], target)
+
+    @staticmethod
+    def _has_bit(bits, row, node):
+        return row >= 0 and bool(int(bits[row, node >> 6]) >> (node & 63) & 1)
+
+    def reachable(self, node):
+        # the ids of the other nodes node can reach, in order
+        return self._nodes(self._forward_bits, self._forward_rows[node], node)
+
+    def reaching(self, node):
+        # the ids of the other nodes that can reach node, in order
+        return self._nodes(self._backward_bits, self._backward_rows[node], node)
+
+    def _nodes(self, bits, row, node):
+        if row < 0:
+            return numpy.zeros(0, dtype=numpy.intp)
+        nodes = numpy.flatnonzero(numpy.unpackbits(bits[row].astype('<u8', copy=False).view(numpy.uint8), count=self.node_count,
+                                                   bitorder='little'))
+        return nodes[nodes != node]
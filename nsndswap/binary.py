@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+# nsndswap/binary.py
+# copyright 2017 ViKomprenas, 2-clause BSD license (LICENSE.md)
+
+# The binary web format, version 1. Everything is little-endian.
+#
+#   header            32 bytes: magic, version, node count, edge count,
+#                     discovered count, string table size, reserved
+#   string_offsets    uint32[nodes + 1], byte offsets into the string table
+#   out_offsets       uint32[nodes + 1], CSR row offsets
+#   out_targets       uint32[edges], CSR targets, grouped by source
+#   out_edge_ids      uint32[edges], the edge id of each CSR slot
+#   discovered        uint32[discovered], nodes with their own reflists, in order
+#   strings           UTF-8 titles, back to back
+#
+# Every array starts on a 4-byte boundary, so a mapped file can be viewed
+# as numpy arrays without copying anything.
+
+import mmap
+import struct
+import sys
+import numpy
+
+MAGIC = b'NSNDWEB\0'
+VERSION = 1
+_HEADER = struct.Struct('<8sIIIIII')
+_UINT32 = numpy.dtype('<u4')
+
+
+class BinaryFormatError(Exception):
+    pass
+
+
+def write_web(outf, nodes, edges, discovered):
+    # nodes is the list of titles, edges a sequence of (from, to) in edge id order
+    edges = numpy.array(edges, dtype=numpy.int64).reshape(-1, 2)
+    encoded = [title.encode('utf-8') for title in nodes]
+    string_offsets = numpy.concatenate(([0], numpy.cumsum([len(x) for x in encoded], dtype=numpy.int64)))
+    out_edge_ids = numpy.argsort(edges[:, 0], kind='stable')
+    out_targets = edges[out_edge_ids, 1]
+    out_offsets = numpy.concatenate(([0], numpy.cumsum(numpy.bincount(edges[:, 0], minlength=len(nodes)))))
+
+    outf.write(_HEADER.pack(MAGIC, VERSION, len(nodes), len(edges), len(discovered), int(string_offsets[-1]), 0))
+    for array in (string_offsets, out_offsets, out_targets, out_edge_ids, numpy.fromiter(discovered, dtype=numpy.int64)):
+        outf.write(array.astype(_UINT32).tobytes())
+    outf.write(b''.join(encoded))
+
+
+class BinaryWeb:
+    # A read-only view of a binary web. The arrays point straight into the
+    # buffer, so nothing is copied until it's asked for.
+    def __init__(self, buffer):
+        self.buffer = buffer
+        if len(buffer) < _HEADER.size:
+            raise BinaryFormatError('file is too short to be a binary web')
+        magic, version, node_count, edge_count, discovered_count, string_size, _ = _HEADER.unpack_from(buffer)
+        if magic != MAGIC:
+            raise BinaryFormatError('not a binary web')
+        if version != VERSION:
+            raise BinaryFormatError(f'unsupported binary web version {version}')
+        self.node_count = node_count
+        self.edge_count = edge_count
+
+        offset = _HEADER.size
+
+        def take(count):
+            nonlocal offset
+            array = numpy.frombuffer(buffer, dtype=_UINT32, count=count, offset=offset)
+            offset += count * _UINT32.itemsize
+            return array
+
+        self.string_offsets = take(node_count + 1)
+        self.out_offsets = take(node_count + 1)
+        self.out_targets = take(edge_count)
+        self.out_edge_ids = take(edge_count)
+        self.discovered = take(discovered_count)
+        self.strings = memoryview(buffer)[offset:offset + string_size]
+        if len(self.strings) != string_size:
+            raise BinaryFormatError('binary web is truncated')
+
+    @classmethod
+    def open(cls, inf):
+        # maps the file if it's a real one, reads it otherwise
+        try:
+            fileno = inf.fileno()
+        except (AttributeError, OSError):
+            return cls(inf.read())
+        return cls(mmap.mmap(fileno, 0, access=mmap.ACCESS_READ))
+
+    def title(self, node_id):
+        return str(self.strings[self.string_offsets[node_id]:self.string_offsets[node_id + 1]], 'utf-8')
+
+    def titles(self):
+        strings = bytes(self.strings)
+        bounds = self.string_offsets.tolist()
+        return [strings[bounds[i]:bounds[i + 1]].decode('utf-8') for i in range(self.node_count)]
+
+    def references(self, node_id):
+        return self.out_targets[self.out_offsets[node_id]:self.out_offsets[node_id + 1]]
+
+    def edge_arrays(self):
+        # (sources, targets) in edge id order
+        sources = numpy.empty(self.edge_count, dtype=numpy.intp)
+        targets = numpy.empty(self.edge_count, dtype=numpy.intp)
+        sources[self.out_edge_ids] = numpy.repeat(numpy.arange(self.node_count), numpy.diff(self.out_offsets))
+        targets[self.out_edge_ids] = self.out_targets
+        return sources, targets
+
+
+def convert_pickle(inf, outf):
+    import pickle
+    import nsndswap.web  # so the pickled Web class can be found
+    web = pickle.load(inf)
+    web.dump_binary(outf)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 3:
+        sys.stderr.write('usage: python3 -m nsndswap.binary <web.pkl> <web.nsndweb>\n')
+        raise SystemExit(2)
+    with open(sys.argv[1], 'rb') as inf, open(sys.argv[2], 'wb') as outf:
+        convert_pickle(inf, outf)
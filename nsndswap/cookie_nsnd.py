@@ -18,8 +18,12 @@
 
 import html.parser
 import enum
+import logging
+import nsndswap.disambiguate
 import nsndswap.util
 
+log = logging.getLogger(__name__)
+
 
 @enum.unique
 class ParseStates(enum.Enum):
@@ -45,6 +49,74 @@ class Benchmarks(enum.IntEnum):
     GAMESCANTE = 3
 
 
+def _not_ref(is_ref):
+    return not is_ref
+
+
+R = nsndswap.disambiguate.Rule
+_LIBERA_ME = [R('"Libera me" from Bowman (Bowmania)', below=Benchmarks.GAMESCANTE),
+              R('"Libera me" from Bowman (Greatest Hits 2)')]
+DUPLICATE_TITLES = {
+    'Moondoctor': [R('Moondoctor (Difarem)', below=Benchmarks.PARTWAY_THROUGH_CANV5), R('Moondoctor (Shwan)')],
+    'Showup': [R('Showup (loading)', below=Benchmarks.IN_THE_BEGINNING), R('Showup (Viridian)')],
+    'Three in the Morning (4 1/3 Hours Late Remix)': [
+        R('Three in the Morning (4 1/3 Hours Late Remix) (voulem. 1)', below=Benchmarks.PARTWAY_THROUGH_CANV5),
+        R('Three in the Morning (4 1/3 Hours Late Remix) (Greatest Hits)')],
+    'Fake Fruit Fiesta': [R('Fake Fruit Fiesta (Volume 2)', below=Benchmarks.PARTWAY_THROUGH_CANV5),
+                          R('Fake Fruit Fiesta (Greatest Hits)')],
+    'Ruses': [R('Ruses (CANWC Sound Test)', below=Benchmarks.IN_THE_BEGINNING), R('Ruses (Median)')],
+    'Downwards': [R('Downwards (9)', below=Benchmarks.GAMESCANTE), R('Downwards (Greatest Hits 2)')],
+    'Midnight': [R('Midnight (Intermishin)', below=Benchmarks.GAMESCANTE), R('Midnight (Greatest Hits 2)')],
+    'Meme Voyage': [R('Meme Voyage (vol. s*x)', below=Benchmarks.GAMESCANTE), R('Meme Voyage (Greatest Hits 2)')],
+    'Vegetal Colina': [R('Vegetal Colina (CANH2)', below=Benchmarks.GAMESCANTE),
+                       R('Vegetal Colina (Greatest Hits 2)')],
+    'Enter with Caliborn: Destruction Adventure': [
+        R('Enter with Caliborn: Destruction Adventure (CANH2)', below=Benchmarks.GAMESCANTE),
+        R('Enter with Caliborn: Destruction Adventure (Greatest Hits 2)')],
+    '“Libera me” from Bowman': _LIBERA_ME,
+    '"Libera me" from Bowman': _LIBERA_ME,
+    'Fighting Spirit ~Double Ascended Form~': [
+        R('Fighting Spirit ~Double Ascended Form~ (vol. 8)', below=Benchmarks.GAMESCANTE),
+        R('Fighting Spirit ~Double Ascended Form~ (Greatest Hits 2)')],
+    '1 Through 15': [R('1 Through 15 (Intermishin)', below=Benchmarks.GAMESCANTE), R('1 Throgh 15 (Greatest Hits 2)')],
+    '72.0x SHOWDOWN COMBO': [R('72.0x SHOWDOWN COMBO (CANH2)', below=Benchmarks.GAMESCANTE),
+                             R('72.0x SHOWDOWN COMBO (Greatest Hits 2)')],
+    'Welcome to Flavortown (Battle Against a Bodacious Foe)': [
+        R('Welcome to Flavortown (locomotif)', below=Benchmarks.GAMESCANTE),
+        R('Welcome to Flavortown (Greatest Hits 2)')],
+    'you have got to be SHITTONG me (temp title)': [
+        R('you have got to be SHITTONG me (9)', below=Benchmarks.GAMESCANTE),
+        R('you have got to be SHITTONG me (Greatest Hits 2)')],
+    'Meldey': [R('Meldey (Basement Tale)', below=Benchmarks.GAMESCANTE), R('Meldey (Rain)')],
+    # two here and one in makin_nsnd
+    'Sunset': [R('Sunset (CANWC)', below=Benchmarks.GAMESCANTE), R('Sunset (Cerulean)')],
+    # There's one of these in makin_nsnd and one here
+    '==>': [R('==> (CANWC)')],
+    # as above
+    'Checkmate': [R('Checkmate (CANWC)', when=_not_ref)],
+    'Light': [R('Light (CANWC)')],
+    'Sunrise': [R('Sunrise (CANWC)')],
+    'Strife Mayhem': [R('Strife Mayhem (CANWC)')],
+    'Explored': [R('Explored (CANWC)')],
+    'Anticipation': [R('Anticipation (CANWC)')],
+    'Rain': [R('Rain (CANWC)')],
+    'Starsetter': [R('Starsetter (CANWC)')],
+    # HA HA HA HA HA HA HA
+    'Fanfare': [R('Showtime (Imp Strife Mix)')],
+    # goddammit yaz I hope nobody references your song
+    'Roundabout': [R('Roundabout (yazshu)')],
+}
+del R
+
+BENCHMARK_TITLES = {
+    'Dogtor (get it?)': Benchmarks.PARTWAY_THROUGH_CANV5,
+    'In the Beginning': Benchmarks.IN_THE_BEGINNING,
+    'Gamescante': Benchmarks.GAMESCANTE,
+}
+
+_disambiguator = nsndswap.disambiguate.Disambiguator(DUPLICATE_TITLES, BENCHMARK_TITLES, Benchmarks)
+
+
 class CookieParser(html.parser.HTMLParser):
     def __init__(self):
         super().__init__()
@@ -59,155 +131,33 @@ class CookieParser(html.parser.HTMLParser):
         if self.active_song is not None:
             if self.active_song.title != "":
                 self.active_song.title = self._check_benchmarks(self.active_song.title.strip())
-                print(f'Finished "{self.active_song.title}"')
+                log.debug('Finished "%s"', self.active_song.title)
                 self.all_songs.append(self.active_song)
                 self.active_song = None
 
     def _check_benchmarks(self, title, *, is_ref=False, update_benchmark=True):
         val = self._check_benchmarks_inner(title, is_ref=is_ref, update_benchmark=update_benchmark)
         if val != title:
-            print(f'[W] Disambiguated "{title}" to "{val}"')
+            log.warning('Disambiguated "%s" to "%s"', title, val)
         return val
 
     def _check_benchmarks_inner(self, title, *, is_ref=False, update_benchmark=True):
         # Check
         title = title.replace('\n', '').replace('  ', ' ')
-        if title == 'Moondoctor':
-            if self.benchmark < Benchmarks.PARTWAY_THROUGH_CANV5:
-                return 'Moondoctor (Difarem)'
-            else:
-                return 'Moondoctor (Shwan)'
-        elif title == 'Showup':
-            if self.benchmark < Benchmarks.IN_THE_BEGINNING:
-                return 'Showup (loading)'
-            else:
-                return 'Showup (Viridian)'
-        elif title == 'Three in the Morning (4 1/3 Hours Late Remix)':
-            if self.benchmark < Benchmarks.PARTWAY_THROUGH_CANV5:
-                return 'Three in the Morning (4 1/3 Hours Late Remix) (voulem. 1)'
-            else:
-                return 'Three in the Morning (4 1/3 Hours Late Remix) (Greatest Hits)'
-        elif title == 'Fake Fruit Fiesta':
-            if self.benchmark < Benchmarks.PARTWAY_THROUGH_CANV5:
-                return 'Fake Fruit Fiesta (Volume 2)'
-            else:
-                return 'Fake Fruit Fiesta (Greatest Hits)'
-        elif title == 'Ruses':
-            if self.benchmark < Benchmarks.IN_THE_BEGINNING:
-                return 'Ruses (CANWC Sound Test)'
-            else:
-                return 'Ruses (Median)'
-        elif title == 'Downwards':
-            if self.benchmark < Benchmarks.GAMESCANTE:
-                return 'Downwards (9)'
-            else:
-                return 'Downwards (Greatest Hits 2)'
-        elif title == 'Midnight':
-            if self.benchmark < Benchmarks.GAMESCANTE:
-                return 'Midnight (Intermishin)'
-            else:
-                return 'Midnight (Greatest Hits 2)'
-        elif title.strip().replace('  ', ' ') == 'Meme Voyage':
-            if self.benchmark < Benchmarks.GAMESCANTE:
-                return 'Meme Voyage (vol. s*x)'
-            else:
-                return 'Meme Voyage (Greatest Hits 2)'
-        elif title == 'Vegetal Colina':
-            if self.benchmark < Benchmarks.GAMESCANTE:
-                return 'Vegetal Colina (CANH2)'
-            else:
-                return 'Vegetal Colina (Greatest Hits 2)'
-        elif title == 'Enter with Caliborn: Destruction Adventure':
-            if self.benchmark < Benchmarks.GAMESCANTE:
-                return 'Enter with Caliborn: Destruction Adventure (CANH2)'
-            else:
-                return 'Enter with Caliborn: Destruction Adventure (Greatest Hits 2)'
-        elif title == '“Libera me” from Bowman' or title == '"Libera me" from Bowman':
-            if self.benchmark < Benchmarks.GAMESCANTE:
-                return '"Libera me" from Bowman (Bowmania)'
-            else:
-                return '"Libera me" from Bowman (Greatest Hits 2)'
-        elif title == 'Fighting Spirit ~Double Ascended Form~':
-            if self.benchmark < Benchmarks.GAMESCANTE:
-                return 'Fighting Spirit ~Double Ascended Form~ (vol. 8)'
-            else:
-                return 'Fighting Spirit ~Double Ascended Form~ (Greatest Hits 2)'
-        elif title == '1 Through 15':
-            if self.benchmark < Benchmarks.GAMESCANTE:
-                return '1 Through 15 (Intermishin)'
-            else:
-                return '1 Throgh 15 (Greatest Hits 2)'
-        elif title == '72.0x SHOWDOWN COMBO':
-            if self.benchmark < Benchmarks.GAMESCANTE:
-                return '72.0x SHOWDOWN COMBO (CANH2)'
-            else:
-                return '72.0x SHOWDOWN COMBO (Greatest Hits 2)'
-        elif title == 'Welcome to Flavortown (Battle Against a Bodacious Foe)':
-            if self.benchmark < Benchmarks.GAMESCANTE:
-                return 'Welcome to Flavortown (locomotif)'
-            else:
-                return 'Welcome to Flavortown (Greatest Hits 2)'
-        elif title == 'you have got to be SHITTONG me (temp title)':
-            if self.benchmark < Benchmarks.GAMESCANTE:
-                return 'you have got to be SHITTONG me (9)'
-            else:
-                return 'you have got to be SHITTONG me (Greatest Hits 2)'
-        elif title == 'Meldey':
-            if self.benchmark < Benchmarks.GAMESCANTE:
-                return 'Meldey (Basement Tale)'
-            else:
-                return 'Meldey (Rain)'
-        elif title == 'Sunset':
-            # two here and one in makin_nsnd
-            if self.benchmark < Benchmarks.GAMESCANTE:
-                return 'Sunset (CANWC)'
-            else:
-                return 'Sunset (Cerulean)'
-        elif title == '==>':
-            # There's one of these in makin_nsnd and one here
-            return '==> (CANWC)'
-        elif title == 'Checkmate' and not is_ref:
-            # as above
-            return 'Checkmate (CANWC)'
-        elif title == 'Light':
-            # as above
-            return 'Light (CANWC)'
-        elif title == 'Sunrise':
-            # as above
-            return 'Sunrise (CANWC)'
-        elif title == 'Strife Mayhem':
-            # as above
-            return 'Strife Mayhem (CANWC)'
-        elif title == 'Explored':
-            # as above
-            return 'Explored (CANWC)'
-        elif title == 'Anticipation':
-            # as above
-            return 'Anticipation (CANWC)'
-        elif title == 'Rain':
-            # as above
-            return 'Rain (CANWC)'
-        elif title == 'Starsetter':
-            # as above
-            return 'Starsetter (CANWC)'
-        elif title == 'Fanfare':
-            # HA HA HA HA HA HA HA
-            return 'Showtime (Imp Strife Mix)'
-        elif title == 'Roundabout':
-            # goddammit yaz I hope nobody references your song
-            return 'Roundabout (yazshu)'
+        key = title
+        if key.strip().replace('  ', ' ') == 'Meme Voyage':
+            # this one turns up with a few extra spaces
+            key = 'Meme Voyage'
+        val = _disambiguator.resolve(key, self.benchmark, is_ref=is_ref)
+        if val is not None:
+            return val
 
         # Update
         if update_benchmark:
-            if title == 'Dogtor (get it?)' and self.benchmark < Benchmarks.PARTWAY_THROUGH_CANV5:
-                print('Reached benchmark: PARTWAY_THROUGH_CANV5')
-                self.benchmark = Benchmarks.PARTWAY_THROUGH_CANV5
-            elif title == 'In the Beginning' and self.benchmark < Benchmarks.IN_THE_BEGINNING:
-                print('Reached benchmark: IN_THE_BEGINNING')
-                self.benchmark = Benchmarks.IN_THE_BEGINNING
-            elif title == 'Gamescante' and self.benchmark < Benchmarks.GAMESCANTE:
-                print('Reached benchmark: GAMESCANTE')
-                self.benchmark = Benchmarks.GAMESCANTE
+            benchmark = _disambiguator.next_benchmark(title, self.benchmark)
+            if benchmark is not None:
+                log.info('Reached benchmark: %s', benchmark.name)
+                self.benchmark = benchmark
 
         return title
 
@@ -244,19 +194,19 @@ class CookieParser(html.parser.HTMLParser):
             if self.state == ParseStates.EATING_REFERENCE:
                 self.state = ParseStates.SEEKING_REFERENCE
                 if len(self.active_song.references) > 0 and self.active_song.references[-1] != "":
-                    print(f'Got a reference from "{self.active_song.title}" to "{self.active_song.references[-1]}"')
+                    log.debug('Got a reference from "%s" to "%s"', self.active_song.title, self.active_song.references[-1])
                 self.got_new_this_round = False
             elif self.state == ParseStates.EATING_TITLE:
                 self.state = ParseStates.SKIPPING_ARTIST
                 if self.active_song.title == "":
                     self.active_song = self.all_songs.pop()
-                    print(f'Resuming "{self.active_song.title}"')
+                    log.debug('Resuming "%s"', self.active_song.title)
                 else:
-                    print(f'Scanning "{self.active_song.title}"')
+                    log.debug('Scanning "%s"', self.active_song.title)
         elif tag == "table":
             self.current_album_has_art = False
             if self.state != ParseStates.SEEKING_REFERENCE:
-                print(f'[W] Reached unexpected end of album in state {self.state}')
+                log.warning('Reached unexpected end of album in state %s', self.state)
                 self._finish_song()
                 self.state = ParseStates.SEEKING_ALBUM
 
@@ -264,13 +214,13 @@ class CookieParser(html.parser.HTMLParser):
         if self.state == ParseStates.DONE:
             return
         if data == 'Non-Homestuck music (Homestuck and CANWC musicians only)':
-            print('Ending cookie_nsnd at non-homestuck section')
+            log.info('Ending cookie_nsnd at non-homestuck section')
             self.state = ParseStates.DONE
         elif self.state == ParseStates.READING_ALBUM_HEADER and data.strip().startswith('T'):
-            print('Noticed that this album has art')
+            log.debug('Noticed that this album has art')
             self.current_album_has_art = True
         elif self.state == ParseStates.READING_ALBUM_HEADER and data.strip().startswith('Album'):
-            print('Noticed that this has an album column, pretending it\'s art')
+            log.debug('Noticed that this has an album column, pretending it\'s art')
             self.current_album_has_art = True
         elif self.state == ParseStates.EATING_TITLE:
             self.active_song.title += data
@@ -286,3 +236,9 @@ def parse(nsnd):
     parser = CookieParser()
     parser.feed(nsnd)
     return parser.all_songs
+
+
+def parse_stream(chunks):
+    parser = CookieParser()
+    nsndswap.util.feed_page(parser, chunks)
+    return parser.all_songs
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+# nsndswap/disambiguate.py
+# copyright 2017 ViKomprenas, 2-clause BSD license (LICENSE.md)
+
+# Both pages have songs that share a title with some other song, and the only
+# way to tell them apart is how far through the page we are (the benchmark)
+# and sometimes what kind of row it's in. The parsers describe that with a
+# table of rules per title, and a table of titles that move the benchmark on.
+
+import collections
+
+
+class Rule(collections.namedtuple('Rule', 'result below when')):
+    # result applies while the benchmark is below `below`, and `when` returns
+    # true for the parser's context; either can be left out
+    __slots__ = ()
+
+    def __new__(cls, result, below=None, when=None):
+        return super().__new__(cls, result, below, when)
+
+    def matches(self, benchmark, context):
+        return (self.below is None or benchmark < self.below) and (self.when is None or self.when(**context))
+
+
+class Disambiguator:
+    def __init__(self, rules, triggers, benchmarks):
+        # rules is {title: [Rule, ...]}, first match wins; triggers is {title: benchmark}
+        self.triggers = dict(triggers)
+        # rules that only look at the benchmark are worked out ahead of time
+        # for every benchmark there is, so they're a couple of dict lookups
+        self._by_benchmark = {}
+        self._with_context = {}
+        for title, title_rules in rules.items():
+            if any(rule.when is not None for rule in title_rules):
+                self._with_context[title] = tuple(title_rules)
+            else:
+                self._by_benchmark[title] = {
+                    benchmark: next((rule.result for rule in title_rules if rule.matches(benchmark, {})), None)
+                    for benchmark in benchmarks
+                }
+
+    def resolve(self, title, benchmark, **context):
+        # the disambiguated title, or None if this title isn't ambiguous here
+        by_benchmark = self._by_benchmark.get(title)
+        if by_benchmark is not None:
+            return by_benchmark[benchmark]
+        for rule in self._with_context.get(title, ()):
+            if rule.matches(benchmark, context):
+                return rule.result
+        return None
+
+    def next_benchmark(self, title, benchmark):
+        # the benchmark reached by seeing title, or None if it doesn't move on
+        target = self.triggers.get(title)
+        if target is not None and benchmark < target:
+            return target
+        return None
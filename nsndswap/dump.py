@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+# nsndswap/dump.py
+# copyright 2017 ViKomprenas, 2-clause BSD license (LICENSE.md)
+
+# Writes every output file for a set of finished webs. Each (web, format)
+# pair is a separate job for a pool of worker processes. The workers get the
+# webs in the binary format (see binary.py) once, when they start, and
+# rebuild a web from it the first time one of its jobs comes along.
+
+import collections
+import concurrent.futures
+import io
+import logging
+import os
+import time
+import nsndswap.gexf
+import nsndswap.layout
+import nsndswap.util
+import nsndswap.web
+
+log = logging.getLogger(__name__)
+
+OUTPUT_DIR = 'output'
+
+
+def _dump_gexf(web, name, options):
+    iterations = options['layout_iterations']
+    if iterations:
+        snapshot = web.snapshot(legacy_placement=options['legacy_placement'])
+        previous = _previous_positions(options['warm_start'], name) if options['warm_start'] else None
+        if previous:
+            # most of the nodes are where they should be already, so only refine it
+            snapshot.warm_start(previous)
+            iterations = min(iterations, nsndswap.layout.FR_WARM_ITERATIONS)
+        snapshot.lay_out(iterations=iterations, theta=options['layout_theta'])
+        with open(os.path.join(OUTPUT_DIR, f'{name}.positions.tsv'), 'w', encoding='utf-8') as f:
+            nsndswap.layout.write_positions(f, snapshot.titles, snapshot.x, snapshot.y)
+    gexf_ext = 'gexf.gz' if options['gzip_gexf'] else 'gexf'
+    with nsndswap.gexf.open_gexf(os.path.join(OUTPUT_DIR, f'{name}.{gexf_ext}')) as f:
+        web.dump_gexf(f, legacy_placement=options['legacy_placement'], size_by=options['size_by'])
+    with nsndswap.gexf.open_gexf(os.path.join(OUTPUT_DIR, f'{name}.reverse.{gexf_ext}')) as f:
+        web.dump_gexf(f, reverse_size=True, legacy_placement=options['legacy_placement'],
+                      size_by=options['size_by'])
+
+
+def _previous_positions(directory, name):
+    # node positions from an earlier run's output, if it has any for this web
+    path = os.path.join(directory, f'{name}.positions.tsv')
+    if os.path.exists(path):
+        log.info('Reading the previous layout of %s from %s', name, path)
+        with open(path, encoding='utf-8') as f:
+            return nsndswap.layout.read_positions(f)
+    for gexf_ext in ('gexf', 'gexf.gz'):
+        path = os.path.join(directory, f'{name}.{gexf_ext}')
+        if os.path.exists(path):
+            log.info('Reading the previous layout of %s from %s', name, path)
+            return nsndswap.gexf.read_positions(path)
+    log.warning('No previous layout of %s in %s, starting from scratch', name, directory)
+    return None
+
+
+def _dump_plaintext(web, name, options):
+    with open(os.path.join(OUTPUT_DIR, f'{name}.txt'), 'w') as f:
+        web.dump_plaintext(f)
+    with open(os.path.join(OUTPUT_DIR, f'{name}.reverse.txt'), 'w') as f:
+        web.dump_plaintext(f, reverse=True)
+
+
+def _dump_lineage(web, name, options):
+    with open(os.path.join(OUTPUT_DIR, f'{name}.lineage.txt'), 'w') as f:
+        web.dump_lineage(f)
+
+
+def _dump_cycles(web, name, options):
+    with open(os.path.join(OUTPUT_DIR, f'{name}.cycles.txt'), 'w') as f:
+        web.dump_cycles(f)
+
+
+def _dump_titles(web, name, options):
+    with open(os.path.join(OUTPUT_DIR, f'{name}.titles.txt'), 'w') as f:
+        web.dump_titles(f)
+
+
+def _dump_unknown(web, name, options):
+    with open(os.path.join(OUTPUT_DIR, f'{name}.unknown.txt'), 'w') as f:
+        web.dump_unknown_references(f)
+
+
+def _dump_suggestions(web, name, options):
+    with open(os.path.join(OUTPUT_DIR, f'{name}.suggestions.txt'), 'w') as f:
+        web.dump_suggestions(f)
+
+
+def _dump_unicode(web, name, options):
+    with open(os.path.join(OUTPUT_DIR, f'{name}.unicode.txt'), 'w') as f:
+        web.dump_unicode_titles(f)
+
+
+# format -> function writing every file of that format for one web; the slow
+# formats come first, so they start as early as possible
+FORMATS = {
+    'gexf': _dump_gexf,
+    'lineage': _dump_lineage,
+    'suggestions': _dump_suggestions,
+    'txt': _dump_plaintext,
+    'cycles': _dump_cycles,
+    'titles': _dump_titles,
+    'unknown': _dump_unknown,
+    'unicode': _dump_unicode,
+}
+
+# set up in each worker by _init_worker
+_binaries = {}  # name -> binary web
+_webs = {}  # name -> Web, loaded from _binaries when first needed
+
+
+def _init_worker(binaries, log_level):
+    _binaries.clear()
+    _binaries.update(binaries)
+    _webs.clear()
+    root = logging.getLogger()
+    if not root.handlers:
+        # started from scratch rather than forked, so nothing was inherited
+        logging.basicConfig(format=nsndswap.util.LOG_FORMAT)
+    root.setLevel(log_level)
+
+
+def _run_job(name, fmt, options):
+    start = time.perf_counter()
+    if name not in _webs:
+        _webs[name] = nsndswap.web.Web.load_binary(io.BytesIO(_binaries[name]))
+    FORMATS[fmt](_webs[name], name, options)
+    return time.perf_counter() - start
+
+
+def dump_webs(webs, *, workers=None, gzip_gexf=False, layout_iterations=0,
+              layout_theta=nsndswap.layout.FR_THETA, warm_start=None, size_by='degree', legacy_placement=False):
+    # webs is {name: Web}; workers is how many processes to use (all the CPUs
+    # by default), and with 1 everything is written from this process. With
+    # layout_iterations, the gexf files are laid out (see layout.py) first,
+    # and the positions are saved as .positions.tsv. warm_start is an earlier
+    # run's output directory, whose layouts are used as starting points.
+    # size_by picks the node sizes in the gexf files from web.SIZE_METRICS,
+    # and legacy_placement gives the nodes their original starting positions
+    # and colours (see web._legacy_place_nodes).
+    options = {'gzip_gexf': gzip_gexf, 'layout_iterations': layout_iterations, 'layout_theta': layout_theta,
+               'warm_start': warm_start, 'size_by': size_by, 'legacy_placement': legacy_placement}
+    binaries = {}
+    for name, web in webs.items():
+        buf = io.BytesIO()
+        web.dump_binary(buf)
+        binaries[name] = buf.getvalue()
+        with open(os.path.join(OUTPUT_DIR, f'{name}.nsndweb'), 'wb') as f:
+            f.write(binaries[name])
+    jobs = [(name, fmt) for fmt in FORMATS for name in webs]
+
+    timings = collections.defaultdict(float)  # format -> total seconds
+    if workers == 1:
+        _webs.clear()
+        _webs.update(webs)
+        for name, fmt in jobs:
+            seconds = _run_job(name, fmt, options)
+            log.info('Dumped %s as %s in %.2fs', name, fmt, seconds)
+            timings[fmt] += seconds
+    else:
+        with concurrent.futures.ProcessPoolExecutor(workers, initializer=_init_worker,
+                                                    initargs=(binaries, logging.getLogger().level)) as executor:
+            futures = {executor.submit(_run_job, name, fmt, options): (name, fmt) for name, fmt in jobs}
+            for future in concurrent.futures.as_completed(futures):
+                name, fmt = futures[future]
+                seconds = future.result()
+                log.info('Dumped %s as %s in %.2fs', name, fmt, seconds)
+                timings[fmt] += seconds
+
+    for fmt in FORMATS:
+        log.info('Dumping %s took %.2fs in total', fmt, timings[fmt])
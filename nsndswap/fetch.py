@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+# nsndswap/fetch.py
+# copyright 2017 ViKomprenas, 2-clause BSD license (LICENSE.md)
+
+import hashlib
+import logging
+import requests
+import requests.adapters
+
+log = logging.getLogger(__name__)
+
+FETCH_TIMEOUT = (10, 60)  # seconds to connect, seconds between bytes
+FETCH_RETRIES = 4
+FETCH_BACKOFF = 1  # seconds, doubled on every retry
+CHUNK_SIZE = 1 << 16  # bytes to read off the connection at a time
+
+
+def make_session():
+    # one pooled session for every fetch, retrying connection errors and
+    # server errors with exponential backoff
+    retry = requests.adapters.Retry(total=FETCH_RETRIES, backoff_factor=FETCH_BACKOFF,
+                                    status_forcelist=(500, 502, 503, 504), raise_on_status=False)
+    adapter = requests.adapters.HTTPAdapter(max_retries=retry)
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+class NsndPage:
+    # The text of a page, iterated over in chunks as it arrives. This can only
+    # be iterated over once. sha256 is the hex digest of the UTF-8 text; it's
+    # known up front for pages from the cache, and once the last chunk has
+    # been read otherwise.
+    def __init__(self, url, chunks, sha256=None):
+        self.url = url
+        self._chunks = chunks
+        self.sha256 = sha256
+
+    def __iter__(self):
+        return iter(self._chunks)
+
+
+def open_nsnd_page(url, session=None, *, cache=None, offline=False):
+    if offline:
+        log.info('Loading %s from cache', url)
+        nsndtext = cache.load(url) if cache is not None else None
+        if nsndtext is None:
+            log.error('%s is not cached, so it can\'t be used offline, aborting', url)
+            raise SystemExit(1)
+        return NsndPage(url, [nsndtext], cache.sha256(url))
+    log.info('Fetching %s', url)
+    try:
+        headers = cache.conditional_headers(url) if cache is not None else {}
+        req = (session or requests).get(url, headers=headers, timeout=FETCH_TIMEOUT, stream=True)
+        if req.status_code == 304 and headers:
+            log.info('%s is unchanged, using the cached copy', url)
+            req.close()
+            return NsndPage(url, [cache.load(url)], cache.sha256(url))
+        elif req.status_code != 200:
+            req.close()
+            log.error('Request for nsnd returned %s, aborting', req.status_code)
+            raise SystemExit(1)
+    except Exception:
+        log.error('Caught an exception while fetching nsnd')
+        raise
+    page = NsndPage(url, None)
+    page._chunks = _stream_response(page, req, cache)
+    return page
+
+
+def _stream_response(page, req, cache):
+    try:
+        if req.encoding is None:
+            # nothing to go on but the content itself, which means reading all of it first
+            req.encoding = req.apparent_encoding
+        chunks = req.iter_content(CHUNK_SIZE, decode_unicode=True)
+        if cache is not None:
+            chunks = cache.store_chunks(page.url, chunks, req.headers)
+        digest = hashlib.sha256()
+        for chunk in chunks:
+            digest.update(chunk.encode('utf-8'))
+            yield chunk
+        req.close()
+    except Exception:
+        log.error('Caught an exception while fetching nsnd')
+        raise
+    page.sha256 = digest.hexdigest()
+    if page.sha256 == hashlib.sha256().hexdigest():
+        log.error('Got a blank page instead of nsnd, aborting')
+        raise SystemExit(1)
+
+
+def get_nsnd_page(url, session=None, *, cache=None, offline=False):
+    nsndtext = ''.join(open_nsnd_page(url, session, cache=cache, offline=offline))
+    if len(nsndtext) == 0:
+        log.error('Got a blank page instead of nsnd, aborting')
+        raise SystemExit(1)
+    return nsndtext.strip().replace('\n', '')
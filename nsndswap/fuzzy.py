@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+# nsndswap/fuzzy.py
+# copyright 2017 ViKomprenas, 2-clause BSD license (LICENSE.md)
+
+# Finding the known titles closest to a misspelt one. Every title is indexed
+# by the trigrams (runs of three characters) in it, ignoring case, so the
+# trigrams each title shares with a query can be counted up for all of them
+# at once. That puts a floor under each title's edit distance, and only the
+# titles whose floor could beat what's been found get their edit distance
+# worked out.
+
+import numpy
+
+SUGGESTIONS = 3  # titles to suggest for each query
+MAX_DISTANCE_RATIO = 0.25  # suggestions are at most this many edits per character of the query
+
+
+def trigrams(title):
+    # padded, so short titles and the ends of titles still count
+    padded = f'  {_fold(title)} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def _fold(title):
+    # Lowercased a character at a time, leaving alone any that would become
+    # more than one (like İ), so an edit to a title is still at most one edit
+    # to its folded form, and the bounds in TrigramIndex.nearest hold for the
+    # edit distance between the titles themselves.
+    return ''.join(lower if len(lower) == 1 else char for char, lower in ((char, char.lower()) for char in title))
+
+
+def edit_distance(a, b, limit=None):
+    # Levenshtein distance, or anything above limit if it's more than that
+    return _edit_distance(_match_masks(a), len(a), b, len(a) + len(b) if limit is None else limit)
+
+
+def _match_masks(a):
+    # character -> bitmask of where it is in a
+    matches = {}
+    for i, char in enumerate(a):
+        matches[char] = matches.get(char, 0) | 1 << i
+    return matches
+
+
+def _edit_distance(matches, length, b, limit):
+    # Myers' bit-parallel algorithm (in Hyyro's form), given _match_masks of
+    # a string of this length: each column of the usual table is a pair of
+    # bitmasks saying where it goes up and down, so every character of b is a
+    # few operations on ints. The bottom row can only come down one per
+    # character left, so it gives up once that can't bring it within limit.
+    if not length:
+        return len(b)
+    every = (1 << length) - 1
+    last = 1 << (length - 1)
+    up = every
+    down = 0
+    distance = length
+    remaining = len(b)
+    for char in b:
+        match = matches.get(char, 0)
+        vertical = match | down
+        horizontal = (((match & up) + up) ^ up) | match
+        horizontal_up = down | (~(horizontal | up) & every)
+        horizontal_down = up & horizontal
+        if horizontal_up & last:
+            distance += 1
+        elif horizontal_down & last:
+            distance -= 1
+        remaining -= 1
+        if distance - remaining > limit:
+            return distance - remaining
+        horizontal_up = (horizontal_up << 1 | 1) & every
+        horizontal_down = (horizontal_down << 1) & every
+        up = horizontal_down | (~(vertical | horizontal_up) & every)
+        down = horizontal_up & vertical
+    return distance
+
+
+class TrigramIndex:
+    def __init__(self, titles):
+        self.titles = list(titles)
+        postings = {}  # trigram -> ids of the titles with it
+        self._lengths = numpy.array([len(title) for title in self.titles], dtype=numpy.intp)
+        self._trigram_counts = numpy.empty(len(self.titles), dtype=numpy.intp)
+        for title_id, title in enumerate(self.titles):
+            title_trigrams = trigrams(title)
+            self._trigram_counts[title_id] = len(title_trigrams)
+            for trigram in title_trigrams:
+                postings.setdefault(trigram, []).append(title_id)
+        # Trigrams most titles have (like the ones in "Song" for titles like
+        # "Song 12") are kept as the ids of the titles without them instead,
+        # so counting them up for a query stays quick.
+        self._postings = {}
+        self._missing = {}  # trigram -> ids of the titles without it
+        everything = numpy.arange(len(self.titles))
+        for trigram, ids in postings.items():
+            ids = numpy.array(ids, dtype=numpy.intp)
+            if len(ids) * 2 > len(self.titles):
+                self._missing[trigram] = numpy.setdiff1d(everything, ids, assume_unique=True)
+            else:
+                self._postings[trigram] = ids
+
+    def nearest(self, title, count=SUGGESTIONS, max_distance=None):
+        # [(known title, edit distance)] for the closest titles, closest first,
+        # leaving out any further than max_distance edits away
+        if max_distance is None:
+            max_distance = int(len(title) * MAX_DISTANCE_RATIO)
+        title_trigrams = trigrams(title)
+        hits = [self._postings[trigram] for trigram in title_trigrams if trigram in self._postings]
+        misses = [self._missing[trigram] for trigram in title_trigrams if trigram in self._missing]
+        if not hits and not misses:
+            return []
+        shared = numpy.full(len(self.titles), len(misses), dtype=numpy.intp)
+        if hits:
+            shared += numpy.bincount(numpy.concatenate(hits), minlength=len(self.titles))
+        if misses:
+            shared -= numpy.bincount(numpy.concatenate(misses), minlength=len(self.titles))
+        # One edit adds or removes at most three trigrams from either title,
+        # and the lengths can only be brought together one edit at a time, so
+        # the distance to each title is at least the larger of those bounds.
+        # Titles that can't be close enough are never looked at, and the rest
+        # are taken in order of how close they might be, until none could beat
+        # what's been found.
+        unshared = numpy.maximum(self._trigram_counts, len(title_trigrams)) - shared
+        bound = numpy.maximum((unshared + 2) // 3, numpy.abs(self._lengths - len(title)))
+        matches = _match_masks(title)
+        results = []
+        for floor in range(max_distance + 1):
+            limit = max_distance if len(results) < count else results[-1][0] - 1
+            if floor > limit:
+                break
+            candidates = numpy.flatnonzero((bound == floor) & (shared > 0))
+            for candidate in candidates[numpy.argsort(-shared[candidates], kind='stable')].tolist():
+                known = self.titles[candidate]
+                distance = _edit_distance(matches, len(title), known, limit)
+                if distance <= limit:
+                    results.append((distance, known))
+                    results.sort()
+                    del results[count:]
+                    if len(results) == count:
+                        limit = results[-1][0] - 1
+                        if floor > limit:
+                            break
+        return [(known, distance) for distance, known in results]
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+# nsndswap/gexf.py
+# copyright 2017 ViKomprenas, 2-clause BSD license (LICENSE.md)
+
+import datetime
+import gzip
+import io
+import itertools
+import xml.etree.ElementTree
+
+CHUNK_SIZE = 1 << 20  # characters to buffer before each write to the real file
+
+_XML_ESCAPES = str.maketrans({
+    '&': '&amp;',
+    '"': '&quot;',
+    '\'': '&apos;',
+    '<': '&lt;',
+    '>': '&gt;',
+})
+
+
+def xmlencode(string):
+    return string.translate(_XML_ESCAPES)
+
+
+def open_gexf(path):
+    # .gexf.gz gets compressed on the way out; the zeroed mtime keeps the bytes reproducible
+    if path.endswith('.gz'):
+        return io.TextIOWrapper(gzip.GzipFile(path, 'wb', mtime=0), encoding='utf-8')
+    return open(path, 'w')
+
+
+def read_positions(path):
+    # {label: (x, y)} for every node with a position in a .gexf or .gexf.gz
+    # file, from this or anything else that writes gexf (Gephi, say)
+    positions = {}
+    with (gzip.open(path, 'rb') if path.endswith('.gz') else open(path, 'rb')) as f:
+        for _, element in xml.etree.ElementTree.iterparse(f):
+            if _local_name(element.tag) != 'node':
+                continue
+            for child in element:
+                if _local_name(child.tag) == 'position':
+                    positions[element.get('label')] = (float(child.get('x')), float(child.get('y')))
+            element.clear()
+    return positions
+
+
+def _local_name(tag):
+    # the tag without its namespace, which depends on the gexf version
+    return tag.rpartition('}')[2]
+
+
+class GexfWriter:
+    def __init__(self, outf, chunk_size=CHUNK_SIZE):
+        self.outf = outf
+        self.chunk_size = chunk_size
+        self._chunk = []
+        self._chunk_len = 0
+
+    def _write(self, text):
+        self._chunk.append(text)
+        self._chunk_len += len(text)
+        if self._chunk_len >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        if self._chunk:
+            self.outf.write(''.join(self._chunk))
+            self._chunk = []
+            self._chunk_len = 0
+
+    def write_graph(self, labels, sizes, xs, ys, colors, sources, targets, attributes=()):
+        # everything is per-node or per-edge sequences, lined up by id;
+        # attributes is a sequence of (title, gexf type, per-node values)
+        self._write(f"""<?xml version="1.0" encoding="UTF-8" ?>
+<gexf xmlns="http://www.gexf.net/1.3" version="1.3" xmlns:viz="http://www.gexf.net/1.3/viz">
+    <meta lastmodifieddate="{str(datetime.date.today())}">
+        <creator>nsndswap</creator>
+        <description>This is a list of references (remixes, arrangements, samples, etc.) in Homestuck music.</description>
+    </meta>
+    <graph mode="static" defaultedgetype="directed">""")
+        if attributes:
+            self._write("""
+        <attributes class="node" mode="static">""")
+            for attribute_id, (title, kind, _) in enumerate(attributes):
+                self._write(f"""
+            <attribute id="{attribute_id}" title="{xmlencode(title)}" type="{kind}"></attribute>""")
+            self._write("""
+        </attributes>""")
+        self._write("""
+        <nodes>""")
+        attvalues = zip(*(values for _, _, values in attributes)) if attributes else itertools.repeat(())
+        for node_id, (label, size, x, y, color, values) in enumerate(zip(labels, sizes, xs, ys, colors, attvalues)):
+            self._write(f"""
+            <node id="{node_id}" label="{xmlencode(label)}">""")
+            if values:
+                self._write("""
+                <attvalues>""")
+                for attribute_id, value in enumerate(values):
+                    self._write(f"""
+                    <attvalue for="{attribute_id}" value="{value}"></attvalue>""")
+                self._write("""
+                </attvalues>""")
+            self._write(f"""
+                <viz:size value="{size}"></viz:size>
+                <viz:position x="{x}" y="{y}"></viz:position>
+                <viz:color r="{color[0]}" g="{color[1]}" b="{color[2]}"></viz:color>
+            </node>""")
+        self._write("""
+        </nodes>
+        <edges>""")
+        for edge_id, (source, target) in enumerate(zip(sources, targets)):
+            self._write(f"""
+            <edge id="{edge_id}" source="{source}" target="{target}">
+                <viz:color r="192" g="192" b="192"></viz:color>
+            </edge>""")
+        self._write("""
+        </edges>
+    </graph>
+</gexf>\n""")
+        self.flush()
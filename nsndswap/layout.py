@@ -0,0 +1,308 @@
+#!/usr/bin/env python3
+# nsndswap/layout.py
+# copyright 2017 ViKomprenas, 2-clause BSD license (LICENSE.md)
+
+# Force-directed layout, done the way GephiBridge.java had Gephi do it:
+# Fruchterman-Reingold with Gephi's constants, and then a pass moving nodes
+# apart until they don't overlap, like Gephi's Noverlap. Positions are numpy
+# arrays of x and y, indexed by node id, and edges are arrays of sources and
+# targets, as in a WebSnapshot.
+
+import logging
+import numpy
+
+log = logging.getLogger(__name__)
+
+AREA_FACTOR = 1.461560947  # area per node
+FR_ITERATIONS = 2000
+FR_SPEED = 2
+FR_GRAVITY = 10
+NOVERLAP_ITERATIONS = 50
+NOVERLAP_RATIO = 1.2
+NOVERLAP_MARGIN = 5
+NOVERLAP_BIG_QUANTILE = 0.95  # nodes bigger than this fraction of all nodes are looked at separately
+
+# Gephi's FruchtermanReingold scales these in
+_AREA_MULTIPLICATOR = 10000
+_SPEED_DIVISOR = 800
+
+FR_THETA = 1.0  # Barnes-Hut accuracy: smaller is more exact and slower, and 0 is exact
+FR_TOLERANCE = 0.1  # stop once nodes get less than this fraction as far as they could, on average...
+FR_SETTLE_WINDOW = 50  # ...over this many iterations
+
+FR_WARM_ITERATIONS = 200  # refinement run after starting from an earlier layout
+WARM_START_SPREAD = 0.1  # how far new nodes land from their neighbours, relative to a cold start
+
+_CHUNK_SIZE = 1 << 22  # node pairs to work on at once, bounding memory use
+_BH_LEAF_SIZE = 8  # nodes per cell aimed for at the bottom of the quadtree
+_BH_MAX_DEPTH = 16
+
+
+def fruchterman_reingold(x, y, sources, targets, *, iterations=FR_ITERATIONS, area=None,
+                         theta=FR_THETA, tolerance=FR_TOLERANCE):
+    # Returns new x and y arrays. Repulsion is approximated with a Barnes-Hut
+    # quadtree, unless theta is 0. Stops before running all the iterations if
+    # the layout settles down, as judged by tolerance (0 never stops early).
+    x = numpy.array(x, dtype=numpy.float64)
+    y = numpy.array(y, dtype=numpy.float64)
+    node_count = len(x)
+    if node_count == 0:
+        return x, y
+    if area is None:
+        area = AREA_FACTOR * node_count
+    k = numpy.sqrt(_AREA_MULTIPLICATOR * area / (1 + node_count))
+    max_displace = numpy.sqrt(_AREA_MULTIPLICATOR * area) / 10 * FR_SPEED / _SPEED_DIVISOR
+    settled_x, settled_y = x.copy(), y.copy()
+    for i in range(iterations):
+        if i % FR_SETTLE_WINDOW == 0 and i > 0:
+            # nodes jostle around forever, so the test is how far they actually got
+            progress = numpy.hypot(x - settled_x, y - settled_y).mean() / (FR_SETTLE_WINDOW * max_displace)
+            log.debug('Running FR iteration number %s, progress %.3f', i, progress)
+            if progress < tolerance:
+                log.info('Layout settled after %s iterations', i)
+                break
+            settled_x[:], settled_y[:] = x, y
+        if theta > 0:
+            dx, dy = _barnes_hut_repulsion(x, y, k, theta)
+        else:
+            dx, dy = _repulsion(x, y, k)
+        # attraction along edges, either way round
+        ex = x[sources] - x[targets]
+        ey = y[sources] - y[targets]
+        attraction = numpy.hypot(ex, ey) / k
+        ax = numpy.bincount(targets, ex * attraction, node_count) - numpy.bincount(sources, ex * attraction, node_count)
+        ay = numpy.bincount(targets, ey * attraction, node_count) - numpy.bincount(sources, ey * attraction, node_count)
+        dx += ax - 0.01 * k * FR_GRAVITY * x
+        dy += ay - 0.01 * k * FR_GRAVITY * y
+        dx *= FR_SPEED / _SPEED_DIVISOR
+        dy *= FR_SPEED / _SPEED_DIVISOR
+        _move(x, y, dx, dy, max_displace)
+    return x, y
+
+
+def place_near_neighbours(x, y, known, sources, targets):
+    # Returns new x and y arrays where every node that isn't known is moved
+    # to the middle of its known neighbours, offset by its own position scaled
+    # down by WARM_START_SPREAD so that new nodes don't land on top of each
+    # other. Nodes that only neighbour new nodes are placed in later rounds;
+    # those with no way to a known node stay where they are.
+    x = numpy.array(x, dtype=numpy.float64)
+    y = numpy.array(y, dtype=numpy.float64)
+    known = numpy.array(known, dtype=bool)
+    offset_x = x * WARM_START_SPREAD
+    offset_y = y * WARM_START_SPREAD
+    node_count = len(x)
+    ends = numpy.concatenate([sources, targets])
+    others = numpy.concatenate([targets, sources])
+    while True:
+        usable = known[others] & ~known[ends]
+        counts = numpy.bincount(ends[usable], minlength=node_count)
+        placed = counts > 0
+        if not placed.any():
+            return x, y
+        sum_x = numpy.bincount(ends[usable], x[others[usable]], node_count)
+        sum_y = numpy.bincount(ends[usable], y[others[usable]], node_count)
+        x[placed] = sum_x[placed] / counts[placed] + offset_x[placed]
+        y[placed] = sum_y[placed] / counts[placed] + offset_y[placed]
+        known |= placed
+
+
+def write_positions(outf, titles, x, y):
+    # one node per line: x, y and title, split by tabs
+    for title, node_x, node_y in zip(titles, x.tolist(), y.tolist()):
+        outf.write(f'{node_x!r}\t{node_y!r}\t{title}\n')
+
+
+def read_positions(inf):
+    # {title: (x, y)} from write_positions
+    positions = {}
+    for line in inf:
+        node_x, node_y, title = line.rstrip('\n').split('\t', 2)
+        positions[title] = (float(node_x), float(node_y))
+    return positions
+
+
+def _repulsion(x, y, k):
+    # every node pushes every other node away with a force of k**2 / distance
+    dx = numpy.zeros_like(x)
+    dy = numpy.zeros_like(y)
+    rows = max(1, _CHUNK_SIZE // len(x))
+    for start in range(0, len(x), rows):
+        xd = x[start:start + rows, None] - x[None, :]
+        yd = y[start:start + rows, None] - y[None, :]
+        dist2 = xd * xd + yd * yd
+        # nodes on top of each other (and every node and itself) don't push
+        with numpy.errstate(divide='ignore'):
+            force = numpy.where(dist2 > 0, k * k / dist2, 0)
+        dx[start:start + rows] = (xd * force).sum(axis=1)
+        dy[start:start + rows] = (yd * force).sum(axis=1)
+    return dx, dy
+
+
+def _barnes_hut_repulsion(x, y, k, theta):
+    # The same forces as _repulsion, but a group of nodes that's far enough
+    # away (a quadtree cell whose side is less than theta times its distance)
+    # pushes as one node of the group's total mass, from its centre of mass.
+    # The tree is walked one level at a time for all the nodes at once,
+    # keeping a frontier of (node, cell) pairs still to be looked at.
+    node_count = len(x)
+    x0 = x.min()
+    y0 = y.min()
+    # a little bigger, so the nodes at the far edges fall inside
+    side = max(x.max() - x0, y.max() - y0, 1e-9) * (1 + 1e-9)
+    depth = int(numpy.clip(numpy.ceil(numpy.log(node_count / _BH_LEAF_SIZE) / numpy.log(4)), 0, _BH_MAX_DEPTH))
+
+    levels = []  # per level: (cell keys in order, each node's cell, cell masses, centres of mass)
+    for level in range(depth + 1):
+        cells_per_side = 1 << level
+        ix = ((x - x0) / side * cells_per_side).astype(numpy.int64)
+        iy = ((y - y0) / side * cells_per_side).astype(numpy.int64)
+        keys, node_cells = numpy.unique(ix * cells_per_side + iy, return_inverse=True)
+        mass = numpy.bincount(node_cells, minlength=len(keys))
+        levels.append((keys, node_cells, mass,
+                       numpy.bincount(node_cells, x, len(keys)) / mass, numpy.bincount(node_cells, y, len(keys)) / mass))
+
+    dx = numpy.zeros_like(x)
+    dy = numpy.zeros_like(y)
+    nodes = numpy.arange(node_count)
+    cells = numpy.zeros(node_count, dtype=numpy.intp)  # there's one cell at the top
+    for level, (keys, node_cells, mass, mass_x, mass_y) in enumerate(levels):
+        xd = x[nodes] - mass_x[cells]
+        yd = y[nodes] - mass_y[cells]
+        dist2 = xd * xd + yd * yd
+        cell_side = side / (1 << level)
+        far = (node_cells[nodes] != cells) & (cell_side * cell_side < theta * theta * dist2)
+        force = k * k * mass[cells[far]] / dist2[far]
+        dx += numpy.bincount(nodes[far], xd[far] * force, node_count)
+        dy += numpy.bincount(nodes[far], yd[far] * force, node_count)
+        nodes = nodes[~far]
+        cells = cells[~far]
+        if level == depth:
+            break
+        # open up the rest into whichever of their four children have nodes in them
+        cells_per_side = 1 << level
+        cell_ix = keys[cells] // cells_per_side * 2
+        cell_iy = keys[cells] % cells_per_side * 2
+        child_keys = levels[level + 1][0]
+        next_nodes, next_cells = [], []
+        for child_ix, child_iy in ((0, 0), (0, 1), (1, 0), (1, 1)):
+            key = (cell_ix + child_ix) * (2 * cells_per_side) + cell_iy + child_iy
+            child = numpy.minimum(numpy.searchsorted(child_keys, key), len(child_keys) - 1)
+            exists = child_keys[child] == key
+            next_nodes.append(nodes[exists])
+            next_cells.append(child[exists])
+        nodes = numpy.concatenate(next_nodes)
+        cells = numpy.concatenate(next_cells)
+
+    # whatever's left is a node and a bottom-level cell close to it, and each
+    # node in that cell pushes on its own
+    node_cells = levels[depth][1]
+    order = numpy.argsort(node_cells, kind='stable')
+    counts = levels[depth][2][cells]
+    starts = numpy.searchsorted(node_cells[order], cells)
+    rank = numpy.arange(counts.sum()) - numpy.repeat(numpy.cumsum(counts) - counts, counts)
+    first = numpy.repeat(nodes, counts)
+    second = order[numpy.repeat(starts, counts) + rank]
+    xd = x[first] - x[second]
+    yd = y[first] - y[second]
+    dist2 = xd * xd + yd * yd
+    # nodes on top of each other (and every node and itself) don't push
+    pushing = dist2 > 0
+    first, xd, yd, dist2 = first[pushing], xd[pushing], yd[pushing], dist2[pushing]
+    dx += numpy.bincount(first, xd * k * k / dist2, node_count)
+    dy += numpy.bincount(first, yd * k * k / dist2, node_count)
+    return dx, dy
+
+
+def _move(x, y, dx, dy, max_displace):
+    # move each node along its displacement, but no further than max_displace
+    # (one limit for every node, or an array of them)
+    dist = numpy.hypot(dx, dy)
+    moving = dist > 0
+    limit = numpy.broadcast_to(max_displace, dist.shape)[moving]
+    scale = numpy.minimum(limit, dist[moving]) / dist[moving]
+    x[moving] += dx[moving] * scale
+    y[moving] += dy[moving] * scale
+
+
+def remove_overlaps(x, y, sizes, *, iterations=NOVERLAP_ITERATIONS):
+    # Pushes overlapping nodes apart, treating each as a circle of its size
+    # scaled by NOVERLAP_RATIO plus NOVERLAP_MARGIN. Stops early once nothing
+    # overlaps. Returns new x and y arrays.
+    x = numpy.array(x, dtype=numpy.float64)
+    y = numpy.array(y, dtype=numpy.float64)
+    radii = numpy.asarray(sizes, dtype=numpy.float64) * NOVERLAP_RATIO + NOVERLAP_MARGIN
+    if len(x) < 2:
+        return x, y
+    # nodes exactly on top of each other get nudged apart in a made-up direction
+    jitter = numpy.random.default_rng(0)
+    for i in range(iterations):
+        first, second = _overlap_candidates(x, y, radii)
+        xd = x[second] - x[first]
+        yd = y[second] - y[first]
+        dist = numpy.hypot(xd, yd)
+        colliding = dist < radii[first] + radii[second]
+        if not colliding.any():
+            log.debug('No overlaps left after %s iterations', i)
+            break
+        first, second, xd, yd, dist = first[colliding], second[colliding], xd[colliding], yd[colliding], dist[colliding]
+        stacked = dist == 0
+        xd[stacked] = jitter.random(stacked.sum()) - 0.5
+        yd[stacked] = jitter.random(stacked.sum()) - 0.5
+        dist[stacked] = numpy.hypot(xd[stacked], yd[stacked])
+        # each node of a colliding pair moves away from the other by half of the
+        # overlap, but never further in total than its worst overlap, so crowds
+        # don't fly apart
+        overlap = (radii[first] + radii[second] - dist) / 2
+        push = overlap / dist
+        dx = numpy.bincount(second, xd * push, len(x)) - numpy.bincount(first, xd * push, len(x))
+        dy = numpy.bincount(second, yd * push, len(x)) - numpy.bincount(first, yd * push, len(x))
+        worst = numpy.zeros_like(x)
+        numpy.maximum.at(worst, first, overlap)
+        numpy.maximum.at(worst, second, overlap)
+        _move(x, y, dx, dy, worst)
+    return x, y
+
+
+def _overlap_candidates(x, y, radii):
+    # Pairs of nodes that might overlap. A few nodes are far bigger than the
+    # rest, so the grid is sized for the small ones, and each big one is just
+    # paired with every other node.
+    small_radius = numpy.quantile(radii, NOVERLAP_BIG_QUANTILE)
+    small = numpy.flatnonzero(radii <= small_radius)
+    big = numpy.flatnonzero(radii > small_radius)
+    first, second = grid_pairs(x[small], y[small], 2 * small_radius)
+    firsts, seconds = [small[first]], [small[second]]
+    for i, node in enumerate(big):
+        # pairs between two big nodes only need to come up once
+        others = numpy.concatenate([small, big[i + 1:]])
+        firsts.append(numpy.full(len(others), node))
+        seconds.append(others)
+    return numpy.concatenate(firsts), numpy.concatenate(seconds)
+
+
+def grid_pairs(x, y, cell_size):
+    # Every pair of distinct nodes (as two arrays of node ids, each pair once
+    # either way round) that are in the same or neighbouring cells of a grid
+    # of cell_size squares, which includes every pair closer than cell_size.
+    cx = numpy.floor((x - x.min()) / cell_size).astype(numpy.int64)
+    cy = numpy.floor((y - y.min()) / cell_size).astype(numpy.int64)
+    width = cx.max() + 3
+    cells = (cy + 1) * width + (cx + 1)
+    order = numpy.argsort(cells, kind='stable')
+    sorted_cells = cells[order]
+    firsts, seconds = [], []
+    # looking at half the neighbours (and the node's own cell) finds each pair once
+    for offset in (0, 1, width - 1, width, width + 1):
+        start = numpy.searchsorted(sorted_cells, cells + offset, 'left')
+        end = numpy.searchsorted(sorted_cells, cells + offset, 'right')
+        counts = end - start
+        first = numpy.repeat(numpy.arange(len(x)), counts)
+        rank = numpy.arange(counts.sum()) - numpy.repeat(numpy.cumsum(counts) - counts, counts)
+        second = order[numpy.repeat(start, counts) + rank]
+        if offset == 0:
+            keep = first < second
+            first, second = first[keep], second[keep]
+        firsts.append(first)
+        seconds.append(second)
+    return numpy.concatenate(firsts), numpy.concatenate(seconds)
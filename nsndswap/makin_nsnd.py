@@ -3,8 +3,12 @@
 
 import html.parser
 import enum
+import logging
+import nsndswap.disambiguate
 import nsndswap.util
 
+log = logging.getLogger(__name__)
+
 
 @enum.unique
 class ParseStates(enum.Enum):
@@ -34,6 +38,90 @@ class Benchmarks(enum.IntEnum):
     NONHOMESTUCK = 999
 
 
+def _unofficial(song_class):
+    return 'unofficial' in song_class
+
+
+R = nsndswap.disambiguate.Rule
+DUPLICATE_TITLES = {
+    'Light': [R('Light (Vol. 5)', below=Benchmarks.ALTERNIABOUND), R('Light (Medium)')],
+    'Let It Snow': [R('Let It Snow (Homestuck for the Holidays)', below=Benchmarks.ALTERNIABOUND),
+                    R('Let It Snow (original)')],
+    'Frost': [R('Frost (Vol. 6)', below=Benchmarks.ALTERNIABOUND), R('Frost (Medium)')],
+    "I Don't Want to Miss a Thing": [R("I Don't Want to Miss a Thing (Bowman cover)", below=Benchmarks.ALTERNIABOUND),
+                                     R("I Don't Want to Miss a Thing (original)")],
+    '~~SIDE 1~~': [R('~~SIDE 1~~ (coloUrs and mayhem: Universe A)', below=Benchmarks.MAYHEM_B),
+                   R('~~SIDE 1~~ (coloUrs and mayhem: Universe B)')],
+    '~~SIDE 2~~': [R('~~SIDE 2~~ (coloUrs and mayhem: Universe A)', below=Benchmarks.MAYHEM_B),
+                   R('~~SIDE 2~~ (coloUrs and mayhem: Universe B)')],
+    '~~ADDITIONAL MAYHEM~~': [R('~~ADDITIONAL MAYHEM~~ (coloUrs and mayhem: Universe A)', below=Benchmarks.MAYHEM_B),
+                              R('~~ADDITIONAL MAYHEM~~ (coloUrs and mayhem: Universe B)')],
+    'Game Over': [R('Game Over (Jailbreak Vol. 1)', below=Benchmarks.ONE_YEAR_OLDER),
+                  R('Game Over (Jailbreak Vol. 1)', when=_unofficial),
+                  R('Game Over (One Year Older)', below=Benchmarks.COLLIDE),
+                  R('Game Over (Stuckhome Syndrome)')],
+    'Under the Hat': [R('Under the Hat (Land of Fans and Music)', below=Benchmarks.ONE_YEAR_OLDER),
+                      R('Under the Hat (Land of Fans and Music)', when=_unofficial),
+                      R('Under the Hat (One Year Older)')],
+    'Red Miles': [R('Red Miles (Vol. 9)', below=Benchmarks.ONE_YEAR_OLDER), R('Red Miles (Land of Fans and Music 2)')],
+    'Disc 1': [R('˚Disc 1˚', below=Benchmarks.COLLIDE),  # LOFAM3
+               R('♪ Disc 1 ♪', below=Benchmarks.LOFAM4),  # Beforus
+               R('Disc 1 (Stable Time Loops and Paradoxes)', below=Benchmarks.CARETAKERS),
+               R('Disc 1 (Stable Time Loops and Paradoxes 2)')],
+    'The End of Something Really Excellent': [
+        R('The End of Something Really Excellent (Stuckhome Syndrome)', below=Benchmarks.LOFAM4),
+        R('The End of Something Really Excellent (Land of Fans and Music 4)')],
+    'Null': [R('Null (Song of Skaia)', below=Benchmarks.MAYHEM_B), R('Null (James Roach)')],
+    'Aggress': [R('Aggress (Weird Puzzle Tunes)', below=Benchmarks.UNRELEASED), R('Aggress (Mark Hadley)')],
+    # this one specifically is just stupid, why bother disambiguating it
+    'Beatdown': [R('Beatdown', below=Benchmarks.UNRELEASED), R('Beatdown (Toby Fox)')],
+    'Already Here': [R('Already Here (Stuckhome Syndrome)', below=Benchmarks.UNRELEASED), R('Already Here (Unknown)')],
+    # There's one of these in canmt and one here
+    '==>': [R('==> (Stuckhome Syndrome)')],
+    # as above
+    'Checkmate': [R('Checkmate (coloUrs and mayhem: Universe B)')],
+    'Fanfare': [R('Fanfare (Jailbreak Vol. 1)')],
+    'Sunrise': [R('Sunrise (One Year Older)')],
+    'Strife Mayhem': [R('Strife Mayhem (Land of Fans and Music 4)')],
+    'Explored': [R('Explored (Toby Fox & George Buzinkai)')],
+    'Sunset': [R('Sunset (Toby Fox)')],
+    'Starsetter': [R('Starsetter (Stable Time Loops and Paradoxes)')],
+    # as above, but in viko_nsnd
+    'Premonition': [R('Premonition (Stuckhome Syndrome)')],
+    'Home': [R('Home (Moons of Theseus)')],
+    # two of these here AND one in canmt. wow
+    'Midnight': [R('Midnight (Land of Fans and Music 4)', below=Benchmarks.UNRELEASED), R('Midnight (Malcolm Brown)')],
+    'Rain': [R('Rain (Medium)', below=Benchmarks.NONHOMESTUCK), R('Rain (Rob Scallon)')],
+    # one is under unreleased, one is Vol. 9
+    'Stress': [R('Stress (Vol. 9)', below=Benchmarks.UNRELEASED), R('Stress (George Buzinkai)')],
+    'Contention': [R('Contention (Land of Fans and Music 3)', below=Benchmarks.UNRELEASED),
+                   R('Contention (Toby Fox & Bill Bolin)')],
+    'Mother': [R('Mother (One Year Older)', below=Benchmarks.UNRELEASED), R('Mother (Malcolm Brown)')],
+    'Mutiny': [R('Mutiny (Ancestral)', below=Benchmarks.UNRELEASED), R('Mutiny (Bill Bolin)')],
+    # as above, but in non-homestuck
+    'Swan Song': [R('Swan Song (Ancestral)', below=Benchmarks.NONHOMESTUCK), R('Swan Song (Set It Off)')],
+    'Main Theme': [R('Breath of the Wild Theme')],
+    'Title Theme': [R('RollerCoaster Tycoon Theme')],
+    'Daydreamer': [R('Daydreamer (Land of Fans and Music 4)', below=Benchmarks.STLAP),
+                   R('Daydreamer (Stable Time Loops and Paradoxes)')],
+    'Cornered': [R('Cornered (Hiveswap Act 2)', below=Benchmarks.CARETAKERS), R('Cornered (Stuckhome Syndrome)')],
+}
+del R
+
+BENCHMARK_TITLES = {
+    # the first song of each album that moves the benchmark on
+    'Rest a While': Benchmarks.ALTERNIABOUND,
+    'Temporal Shenanigans': Benchmarks.MAYHEM_B,
+    'Cancerous Core': Benchmarks.ONE_YEAR_OLDER,
+    'Creata (Canon Edit)': Benchmarks.COLLIDE,
+    'Merge': Benchmarks.LOFAM4,
+    'Solicide': Benchmarks.STLAP,
+    'A Paradox Legend': Benchmarks.CARETAKERS,
+}
+
+_disambiguator = nsndswap.disambiguate.Disambiguator(DUPLICATE_TITLES, BENCHMARK_TITLES, Benchmarks)
+
+
 class MakinParser(html.parser.HTMLParser):
     def __init__(self):
         super().__init__()
@@ -56,13 +144,13 @@ class MakinParser(html.parser.HTMLParser):
                 if self.allow_resume:
                     self.active_song = self.all_songs.pop()
                     self.state = ParseStates.SEEKING_REFERENCE
-                    print(f'Resuming "{self.active_song.title}"')
+                    log.debug('Resuming "%s"', self.active_song.title)
                 else:
                     if self.benchmark >= Benchmarks.UNRELEASED:
-                        print('Skipped a resume in unreleased, re-enabling resume')
+                        log.debug('Skipped a resume in unreleased, re-enabling resume')
                         self.allow_resume = True
                     else:
-                        print('Skipped a resume')
+                        log.debug('Skipped a resume')
             else:
                 self.song_class = attrs['class']
                 if 'original' in attrs['class']:
@@ -81,17 +169,17 @@ class MakinParser(html.parser.HTMLParser):
         if self.state == ParseStates.DONE:
             return
         if data == ' Unreleased or removed songs':  # note the leading space
-            print('Reached unreleased')
+            log.info('Reached unreleased')
             self.state = ParseStates.SEEKING_SONG
             self.benchmark = Benchmarks.UNRELEASED
         elif data == ' Non-Homestuck songs':  # note the leading space
-            print('Reached non-Homestuck songs')
+            log.info('Reached non-Homestuck songs')
             self.state = ParseStates.SEEKING_UNHOMESTUCK
             self.benchmark = Benchmarks.NONHOMESTUCK
         elif self.state == ParseStates.SKIPPING_ORIGINAL_SONG:
             data = self._check_duplicate_title(data)
             self.all_songs.append(nsndswap.util.Track(data))
-            print(f'Skipping "{self.all_songs[-1].title}" (flagged as original)')
+            log.debug('Skipping "%s" (flagged as original)', self.all_songs[-1].title)
             self.state = ParseStates.SEEKING_SONG
             self.allow_resume = False
         elif self.state == ParseStates.FOUND_SONG:
@@ -101,21 +189,21 @@ class MakinParser(html.parser.HTMLParser):
             self.active_song = nsndswap.util.Track(data)
             self.state = ParseStates.SEEKING_REFERENCE
             self.allow_resume = True
-            print(f'Scanning song "{self.active_song.title}"')
+            log.debug('Scanning song "%s"', self.active_song.title)
         elif self.state == ParseStates.EATING_REFERENCE:
             if data == "":
                 return
             if data == "[see CANWC list]":
-                print(f'Skipping "{self.active_song.title} linking to cookie list')
+                log.debug('Skipping "%s linking to cookie list', self.active_song.title)
             else:
-                print(f'Got "{self.active_song.title}" referencing "{data}"')
+                log.debug('Got "%s" referencing "%s"', self.active_song.title, data)
                 self.active_song.references.append(data)
             self.state = ParseStates.SEEKING_REFERENCE
         elif self.state == ParseStates.EATING_UNHOMESTUCK:
             if data == "":
                 return
             data = self._check_duplicate_title(data)
-            print(f'Got unhomestuck song "{data}"')
+            log.debug('Got unhomestuck song "%s"', data)
             self.all_songs.append(nsndswap.util.Track(data))
             self.state = ParseStates.SEEKING_UNHOMESTUCK
 
@@ -130,218 +218,32 @@ class MakinParser(html.parser.HTMLParser):
             self.all_songs.append(self.active_song)
             self.active_song = None
             if self.benchmark == Benchmarks.UNRELEASED:
-                print('Disabling resume for unreleased')
+                log.info('Disabling resume for unreleased')
                 self.allow_resume = False
         elif self.state == ParseStates.SKIPPING_ARTIST_NAME and tag == "td":
             self.state = ParseStates.SEEKING_SONG
         elif tag == 'body':
             self.state = ParseStates.DONE
-            print('Finished at </body>')
+            log.info('Finished at </body>')
 
     def _check_duplicate_title(self, title, *, update_benchmark=True):
         val = self._check_duplicate_title_inner(title, update_benchmark=update_benchmark)
         if val != title:
-            print(f'[W] Disambiguated "{title}" to "{val}", class is "{self.song_class}"')
+            log.warning('Disambiguated "%s" to "%s", class is "%s"', title, val, self.song_class)
         return val
 
     def _check_duplicate_title_inner(self, title, *, update_benchmark=True):
         # Check duplicates relative to benchmark
-        if title == 'Light':
-            if self.benchmark < Benchmarks.ALTERNIABOUND:
-                return 'Light (Vol. 5)'
-            else:
-                return 'Light (Medium)'
-        if title == 'Let It Snow':
-            if self.benchmark < Benchmarks.ALTERNIABOUND:
-                return 'Let It Snow (Homestuck for the Holidays)'
-            else:
-                return 'Let It Snow (original)'
-        elif title == 'Frost':
-            if self.benchmark < Benchmarks.ALTERNIABOUND:
-                return 'Frost (Vol. 6)'
-            else:
-                return 'Frost (Medium)'
-        elif title == "I Don't Want to Miss a Thing":
-            if self.benchmark < Benchmarks.ALTERNIABOUND:
-                return "I Don't Want to Miss a Thing (Bowman cover)"
-            else:
-                return "I Don't Want to Miss a Thing (original)"
-        elif title == '~~SIDE 1~~':
-            if self.benchmark < Benchmarks.MAYHEM_B:
-                return '~~SIDE 1~~ (coloUrs and mayhem: Universe A)'
-            else:
-                return '~~SIDE 1~~ (coloUrs and mayhem: Universe B)'
-        elif title == '~~SIDE 2~~':
-            if self.benchmark < Benchmarks.MAYHEM_B:
-                return '~~SIDE 2~~ (coloUrs and mayhem: Universe A)'
-            else:
-                return '~~SIDE 2~~ (coloUrs and mayhem: Universe B)'
-        elif title == '~~ADDITIONAL MAYHEM~~':
-            if self.benchmark < Benchmarks.MAYHEM_B:
-                return '~~ADDITIONAL MAYHEM~~ (coloUrs and mayhem: Universe A)'
-            else:
-                return '~~ADDITIONAL MAYHEM~~ (coloUrs and mayhem: Universe B)'
-        elif title == 'Game Over':
-            if self.benchmark < Benchmarks.ONE_YEAR_OLDER or 'unofficial' in self.song_class:
-                return 'Game Over (Jailbreak Vol. 1)'
-            elif self.benchmark < Benchmarks.COLLIDE:
-                return 'Game Over (One Year Older)'
-            else:
-                return 'Game Over (Stuckhome Syndrome)'
-        elif title == 'Under the Hat':
-            if self.benchmark < Benchmarks.ONE_YEAR_OLDER or 'unofficial' in self.song_class:
-                return 'Under the Hat (Land of Fans and Music)'
-            else:
-                return 'Under the Hat (One Year Older)'
-        elif title == 'Red Miles':
-            if self.benchmark < Benchmarks.ONE_YEAR_OLDER:
-                return 'Red Miles (Vol. 9)'
-            else:
-                return 'Red Miles (Land of Fans and Music 2)'
-        elif title == 'Disc 1':
-            if self.benchmark < Benchmarks.COLLIDE:
-                return '˚Disc 1˚'  # LOFAM3
-            elif self.benchmark < Benchmarks.LOFAM4:
-                return '♪ Disc 1 ♪'  # Beforus
-            elif self.benchmark < Benchmarks.CARETAKERS:
-                return 'Disc 1 (Stable Time Loops and Paradoxes)'
-            else:
-                return 'Disc 1 (Stable Time Loops and Paradoxes 2)'
-        elif title == 'The End of Something Really Excellent':
-            if self.benchmark < Benchmarks.LOFAM4:
-                return 'The End of Something Really Excellent (Stuckhome Syndrome)'
-            else:
-                return 'The End of Something Really Excellent (Land of Fans and Music 4)'
-        elif title == 'Null':
-            if self.benchmark < Benchmarks.MAYHEM_B:
-                return 'Null (Song of Skaia)'
-            else:
-                return 'Null (James Roach)'
-        elif title == 'Aggress':
-            if self.benchmark < Benchmarks.UNRELEASED:
-                return 'Aggress (Weird Puzzle Tunes)'
-            else:
-                return 'Aggress (Mark Hadley)'
-        elif title == 'Beatdown':
-            if self.benchmark < Benchmarks.UNRELEASED:
-                return 'Beatdown'  # this one specifically is just stupid, why bother disambiguating it
-            else:
-                return 'Beatdown (Toby Fox)'
-        elif title == 'Already Here':
-            if self.benchmark < Benchmarks.UNRELEASED:
-                return 'Already Here (Stuckhome Syndrome)'
-            else:
-                return 'Already Here (Unknown)'
-        elif title == '==>':
-            # There's one of these in canmt and one here
-            return '==> (Stuckhome Syndrome)'
-        elif title == 'Checkmate':
-            # as above
-            return 'Checkmate (coloUrs and mayhem: Universe B)'
-        elif title == 'Fanfare':
-            # as above
-            return 'Fanfare (Jailbreak Vol. 1)'
-        elif title == 'Sunrise':
-            # as above
-            return 'Sunrise (One Year Older)'
-        elif title == 'Strife Mayhem':
-            # as above
-            return 'Strife Mayhem (Land of Fans and Music 4)'
-        elif title == 'Explored':
-            # as above
-            return 'Explored (Toby Fox & George Buzinkai)'
-        elif title == 'Sunset':
-            # as above
-            return 'Sunset (Toby Fox)'
-        elif title == 'Starsetter':
-            # as above
-            return 'Starsetter (Stable Time Loops and Paradoxes)'
-        elif title == 'Premonition':
-            # as above, but in viko_nsnd
-            return 'Premonition (Stuckhome Syndrome)'
-        elif title == 'Home':
-            # as above
-            return 'Home (Moons of Theseus)'
-        elif title == 'Midnight':
-            # two of these here AND one in canmt. wow
-            if self.benchmark >= Benchmarks.UNRELEASED:
-                return 'Midnight (Malcolm Brown)'
-            else:
-                return 'Midnight (Land of Fans and Music 4)'
-        elif title == 'Rain':
-            # as above
-            if self.benchmark >= Benchmarks.NONHOMESTUCK:
-                return 'Rain (Rob Scallon)'
-            else:
-                return 'Rain (Medium)'
-        elif title == 'Stress':
-            # one is under unreleased, one is Vol. 9
-            if self.benchmark >= Benchmarks.UNRELEASED:
-                return 'Stress (George Buzinkai)'
-            else:
-                return 'Stress (Vol. 9)'
-        elif title == 'Contention':
-            # as above
-            if self.benchmark >= Benchmarks.UNRELEASED:
-                return 'Contention (Toby Fox & Bill Bolin)'
-            else:
-                return 'Contention (Land of Fans and Music 3)'
-        elif title == 'Mother':
-            # as above
-            if self.benchmark >= Benchmarks.UNRELEASED:
-                return 'Mother (Malcolm Brown)'
-            else:
-                return 'Mother (One Year Older)'
-        elif title == 'Mutiny':
-            # as above
-            if self.benchmark >= Benchmarks.UNRELEASED:
-                return 'Mutiny (Bill Bolin)'
-            else:
-                return 'Mutiny (Ancestral)'
-        elif title == 'Swan Song':
-            # as above, but in non-homestuck
-            if self.benchmark >= Benchmarks.NONHOMESTUCK:
-                return 'Swan Song (Set It Off)'
-            else:
-                return 'Swan Song (Ancestral)'
-        elif title == 'Main Theme':
-            return 'Breath of the Wild Theme'
-        elif title == 'Title Theme':
-            return 'RollerCoaster Tycoon Theme'
-        elif title == 'Daydreamer':
-            if self.benchmark >= Benchmarks.STLAP:
-                return 'Daydreamer (Stable Time Loops and Paradoxes)'
-            else:
-                return 'Daydreamer (Land of Fans and Music 4)'
-        elif title == 'Cornered':
-            if self.benchmark >= Benchmarks.CARETAKERS:
-                return 'Cornered (Stuckhome Syndrome)'
-            else:
-                return 'Cornered (Hiveswap Act 2)'
+        val = _disambiguator.resolve(title, self.benchmark, song_class=self.song_class)
+        if val is not None:
+            return val
 
         # Update benchmark
         if update_benchmark:
-            if title == 'Rest a While' and self.benchmark < Benchmarks.ALTERNIABOUND:
-                print('Reached benchmark: ALTERNIABOUND')
-                self.benchmark = Benchmarks.ALTERNIABOUND
-            elif title == 'Temporal Shenanigans' and self.benchmark < Benchmarks.MAYHEM_B:
-                print('Reached benchmark: MAYHEM_B')
-                self.benchmark = Benchmarks.MAYHEM_B
-            elif title == 'Cancerous Core' and self.benchmark < Benchmarks.ONE_YEAR_OLDER:
-                print('Reached benchmark: ONE_YEAR_OLDER')
-                self.benchmark = Benchmarks.ONE_YEAR_OLDER
-            elif title == 'Creata (Canon Edit)' and self.benchmark < Benchmarks.COLLIDE:
-                print('Reached benchmark: COLLIDE')
-                self.benchmark = Benchmarks.COLLIDE
-            elif title == 'Merge' and self.benchmark < Benchmarks.LOFAM4:
-                print('Reached benchmark: LOFAM4')
-                self.benchmark = Benchmarks.LOFAM4
-            elif title == 'Solicide' and self.benchmark < Benchmarks.STLAP:
-                print('Reached benchmark: STLAP')
-                self.benchmark = Benchmarks.STLAP
-            elif title == 'A Paradox Legend' and self.benchmark < Benchmarks.CARETAKERS:
-                print('Reached benchmark: CARETAKERS')
-                self.benchmark = Benchmarks.CARETAKERS
+            benchmark = _disambiguator.next_benchmark(title, self.benchmark)
+            if benchmark is not None:
+                log.info('Reached benchmark: %s', benchmark.name)
+                self.benchmark = benchmark
 
         return title
 
@@ -350,3 +252,9 @@ def parse(nsnd):
     parser = MakinParser()
     parser.feed(nsnd)
     return parser.all_songs
+
+
+def parse_stream(chunks):
+    parser = MakinParser()
+    nsndswap.util.feed_page(parser, chunks)
+    return parser.all_songs
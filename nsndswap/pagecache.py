@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+# nsndswap/pagecache.py
+# copyright 2017 ViKomprenas, 2-clause BSD license (LICENSE.md)
+
+# PageCache keeps the last copy of every fetched page on disk, along with
+# the validators (ETag and Last-Modified) the server sent with it, so the
+# next fetch can be a conditional GET. Each URL gets a pair of files named
+# after a hash of the URL: <key>.html holds the decoded page as UTF-8, and
+# <key>.json holds the URL and its validators.
+#
+# ParseCache keeps the postprocessed tracks from the last parse of each
+# source, keyed by a hash of the page and of all the code and tables that
+# turned it into tracks, so an unchanged page isn't parsed again.
+
+import hashlib
+import json
+import os
+import nsndswap.util
+
+
+def _write_atomically(path, data):
+    # write beside the real file and swap it in, so a killed run can't leave half a file
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path + '.tmp', 'wb') as f:
+        f.write(data)
+    os.replace(path + '.tmp', path)
+
+
+class PageCache:
+    def __init__(self, directory):
+        self.directory = directory
+
+    def _path(self, url, ext):
+        key = hashlib.sha256(url.encode('utf-8')).hexdigest()[:32]
+        return os.path.join(self.directory, f'{key}.{ext}')
+
+    def metadata(self, url):
+        try:
+            with open(self._path(url, 'json'), encoding='utf-8') as f:
+                metadata = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if metadata.get('url') != url or not os.path.exists(self._path(url, 'html')):
+            return None
+        return metadata
+
+    def conditional_headers(self, url):
+        metadata = self.metadata(url)
+        if metadata is None:
+            return {}
+        headers = {}
+        if metadata.get('etag'):
+            headers['If-None-Match'] = metadata['etag']
+        if metadata.get('last_modified'):
+            headers['If-Modified-Since'] = metadata['last_modified']
+        return headers
+
+    def load(self, url):
+        if self.metadata(url) is None:
+            return None
+        with open(self._path(url, 'html'), encoding='utf-8', newline='') as f:
+            return f.read()
+
+    def sha256(self, url):
+        # hex digest of the cached page's UTF-8 text
+        metadata = self.metadata(url)
+        if metadata is None:
+            return None
+        if metadata.get('sha256') is None:
+            with open(self._path(url, 'html'), 'rb') as f:
+                metadata['sha256'] = hashlib.sha256(f.read()).hexdigest()
+        return metadata['sha256']
+
+    def store_chunks(self, url, chunks, headers):
+        # Passes chunks of a page's text through, writing them to the cache on
+        # the way. The cached copy and its validators are left alone until the
+        # last chunk has gone by, so a download that fails partway still
+        # leaves the old copy usable, and it's only replaced if the new page
+        # wasn't blank.
+        path = self._path(url, 'html')
+        os.makedirs(self.directory, exist_ok=True)
+        digest = hashlib.sha256()
+        written = 0
+        try:
+            with open(path + '.tmp', 'w', encoding='utf-8', newline='') as f:
+                for chunk in chunks:
+                    written += f.write(chunk)
+                    digest.update(chunk.encode('utf-8'))
+                    yield chunk
+            if written == 0:
+                return
+            try:
+                # the old validators mustn't outlive the old page
+                os.remove(self._path(url, 'json'))
+            except FileNotFoundError:
+                pass
+            os.replace(path + '.tmp', path)
+        finally:
+            if os.path.exists(path + '.tmp'):
+                os.remove(path + '.tmp')
+        _write_atomically(self._path(url, 'json'), json.dumps({
+            'url': url,
+            'etag': headers.get('ETag'),
+            'last_modified': headers.get('Last-Modified'),
+            'sha256': digest.hexdigest(),
+        }).encode('utf-8'))
+
+
+class ParseCache:
+    def __init__(self, directory):
+        self.directory = directory
+
+    @staticmethod
+    def key(page_sha256, *fingerprints):
+        # fingerprints are strings describing everything else the result depends on
+        digest = hashlib.sha256(page_sha256.encode('ascii'))
+        for fingerprint in fingerprints:
+            digest.update(b'\0' + fingerprint.encode('utf-8'))
+        return digest.hexdigest()
+
+    def _path(self, name):
+        return os.path.join(self.directory, f'{name}.json')
+
+    def load(self, name, key):
+        try:
+            with open(self._path(name), encoding='utf-8') as f:
+                cached = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if cached.get('key') != key:
+            return None
+        return [nsndswap.util.Track(title, references) for title, references in cached['tracks']]
+
+    def store(self, name, key, tracks):
+        _write_atomically(self._path(name), json.dumps({
+            'key': key,
+            'tracks': [[track.title, track.references] for track in tracks],
+        }, ensure_ascii=False, separators=(',', ':')).encode('utf-8'))
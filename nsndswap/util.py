@@ -2,6 +2,8 @@
 # nsndswap/util.py
 # copyright 2017 ViKomprenas, 2-clause BSD license (LICENSE.md)
 
+LOG_FORMAT = '[%(levelname).1s] %(message)s'  # [W] for warnings, and so on
+
 
 class Track(object):
     # encapsulation? what encapsulation? just use the properties
@@ -18,3 +20,25 @@ def split_attrs(attrs):
     for attr in attrs:
         ret[attr[0]] = attr[1]
     return ret
+
+
+def feed_page(parser, chunks):
+    # Feeds an HTMLParser a page arriving in chunks, cleaned up the way the
+    # whole page used to be with .strip().replace('\n', ''). HTMLParser hands
+    # out text as soon as it sees it, which would split text running across a
+    # chunk boundary in two, so everything from the last '<' onwards is held
+    # back until the next chunk comes in.
+    pending = ''
+    started = False
+    for chunk in chunks:
+        pending += chunk.replace('\n', '')
+        if not started:
+            pending = pending.lstrip()
+            started = bool(pending)
+        cut = pending.rfind('<')
+        if cut > 0:
+            parser.feed(pending[:cut])
+            pending = pending[cut:]
+    pending = pending.rstrip()
+    if pending:
+        parser.feed(pending)
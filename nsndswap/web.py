@@ -2,11 +2,20 @@
 # nsndswap/web.py
 # copyright 2017 ViKomprenas, 2-clause BSD license (LICENSE.md)
 
-import datetime
+import functools
+import hashlib
+import logging
 import random
 import colorsys
+import numpy
+import nsndswap.analytics
+import nsndswap.binary
+import nsndswap.fuzzy
+import nsndswap.gexf
+import nsndswap.layout
 import nsndswap.util
 
+log = logging.getLogger(__name__)
 
 BOX_SIDE_MAXDEV = 5
 BOX_SIDE_STDDEV = 100
@@ -15,36 +24,126 @@ SIZE_OFFSET = 3
 SATURATION = 0.5
 VALUE = 0.9
 
+# what node sizes can be based on -> the snapshot fields used for (normal, reversed) sizes
+SIZE_METRICS = {
+    'degree': ('in_deg', 'out_deg'),
+    'pagerank': ('pagerank', 'reverse_pagerank'),
+    'hits': ('authority', 'hub'),
+    'transitive': ('transitive_in', 'transitive_out'),
+}
+# (title, type, snapshot field) of each node attribute in the gexf files
+GEXF_ATTRIBUTES = [
+    ('pagerank', 'double', 'pagerank'),
+    ('reverse pagerank', 'double', 'reverse_pagerank'),
+    ('hub', 'double', 'hub'),
+    ('authority', 'double', 'authority'),
+    ('transitively referenced by', 'integer', 'transitive_in'),
+    ('transitively references', 'integer', 'transitive_out'),
+    ('component', 'integer', 'component'),
+    ('component size', 'integer', 'component_size'),
+]
+
 
 def _tween(amount, start, end):
     difference = end - start
     return start + (difference * amount)
 
 
-def _xmlencode(string):
-    chars = {
-        # note that this one has to be first, or else the other &s are caught
-        '&': '&amp;',
-        '"': '&quot;',
-        '\'': '&apos;',
-        '<': '&lt;',
-        '>': '&gt;',
-    }
-    for ch in chars.keys():
-        string = string.replace(ch, chars[ch])
-    return string
+def _hsv_to_rgb(h, s, v):
+    # colorsys.hsv_to_rgb over a whole array of hues, scaled to between 0 and 256
+    i = numpy.floor(h * 6.0)
+    f = h * 6.0 - i
+    p = numpy.full_like(h, v * (1.0 - s))
+    q = v * (1.0 - s * f)
+    t = v * (1.0 - s * (1.0 - f))
+    v = numpy.full_like(h, v)
+    i = i.astype(numpy.intp) % 6
+    rgb = numpy.stack([
+        numpy.choose(i, [v, q, p, p, t, v]),
+        numpy.choose(i, [t, v, v, q, p, p]),
+        numpy.choose(i, [p, p, t, v, v, q]),
+    ], axis=1)
+    return numpy.round(rgb * 255).astype(numpy.uint8)
+
+
+def _place_nodes(titles):
+    # Each title is hashed to three uniform numbers: two make a gaussian
+    # position (Box-Muller), the third is the hue. The hash doesn't depend on
+    # the Python version or PYTHONHASHSEED, so titles stay put between runs.
+    digests = b''.join(hashlib.blake2b(title.encode('utf-8'), digest_size=12).digest() for title in titles)
+    uniform = numpy.frombuffer(digests, dtype='<u4').reshape(-1, 3) / 2.0 ** 32
+    radius = numpy.sqrt(-2.0 * numpy.log1p(-uniform[:, 0])) * BOX_SIDE_STDDEV
+    angle = 2.0 * numpy.pi * uniform[:, 1]
+    limit = BOX_SIDE_STDDEV * BOX_SIDE_MAXDEV
+    x = numpy.clip(radius * numpy.cos(angle), -limit, limit)
+    y = numpy.clip(radius * numpy.sin(angle), -limit, limit)
+    return x, y, _hsv_to_rgb(uniform[:, 2], SATURATION, VALUE)
+
+
+def _legacy_place_nodes(titles):
+    # The original per-node placement, seeding a random.Random with each title
+    x = numpy.empty(len(titles))
+    y = numpy.empty(len(titles))
+    color = numpy.empty((len(titles), 3), dtype=numpy.uint8)
+
+    def make_component(r):
+        return min(max(r.gauss(0, BOX_SIDE_STDDEV), -BOX_SIDE_STDDEV * BOX_SIDE_MAXDEV),
+                   BOX_SIDE_STDDEV * BOX_SIDE_MAXDEV)
+
+    for i in range(len(titles)):
+        r = random.Random()
+        r.seed(titles[i])
+        x[i] = make_component(r)
+        y[i] = make_component(r)
+        color[i] = tuple(round(x * 255) for x
+            in colorsys.hsv_to_rgb(r.random(), SATURATION, VALUE))
+    return x, y, color
 
 
 class NodeSnapshot:
-    def __init__(self):
-        self.original_index = None
-        self.in_deg = 0
-        self.out_deg = 0
-        self.weighted_in_deg = 0
-        self.weighted_out_deg = 0
-        self.color = (0, 0, 0)  # between 0 and 256
-        self.size = 1
-        self.position = 0 + 0j
+    # A view of one node in a WebSnapshot, for code that wants per-node attributes
+    __slots__ = ('_snapshot', 'index', '_reverse_size', '_size_by')
+    original_index = None
+
+    def __init__(self, snapshot, index, reverse_size=False, size_by='degree'):
+        self._snapshot = snapshot
+        self.index = index
+        self._reverse_size = reverse_size
+        self._size_by = size_by
+
+    @property
+    def name(self):
+        return self._snapshot.titles[self.index]
+
+    @property
+    def in_deg(self):
+        return int(self._snapshot.in_deg[self.index])
+
+    @property
+    def out_deg(self):
+        return int(self._snapshot.out_deg[self.index])
+
+    @property
+    def weighted_in_deg(self):
+        return float(self._snapshot.weighted_in_deg[self.index])
+
+    @property
+    def weighted_out_deg(self):
+        return float(self._snapshot.weighted_out_deg[self.index])
+
+    @property
+    def color(self):
+        # between 0 and 256
+        return tuple(self._snapshot.color[self.index].tolist())
+
+    @property
+    def size(self):
+        return float(self._snapshot.sizes(self._reverse_size, self._size_by)[self.index])
+
+    @property
+    def position(self):
+        x, y = self._snapshot.positions(self._reverse_size, self._size_by)
+        return complex(x[self.index], y[self.index])
 
     @property
     def deg(self):
@@ -55,182 +154,445 @@ class NodeSnapshot:
         return max(self.weighted_in_deg, self.weighted_out_deg)
 
 
+class WebSnapshot:
+    # Everything about the nodes that doesn't depend on which way the sizes
+    # point, so the normal and reversed dumps can share it. Stored as one
+    # array per field, indexed by node id.
+    def __init__(self, web, *, legacy_placement=False):
+        node_count = len(web.nodes)
+        self.titles = web.nodes
+        self.legacy_placement = legacy_placement
+        self._sizes = {}  # (size_by, reverse_size) -> sizes
+        self._positions = {}  # (size_by, reverse_size) -> positions with overlaps removed
+        self._overlap_iterations = 0  # set by lay_out
+
+        log.info('Adding edges to snapshot')
+        edges = numpy.fromiter((x for edge in web._edges for x in edge), dtype=numpy.intp,
+                               count=2 * len(web._edges)).reshape(-1, 2)
+        self.sources = edges[:, 0]
+        self.targets = edges[:, 1]
+
+        log.info('Adding degrees to snapshot')
+        self.in_deg = numpy.bincount(self.targets, minlength=node_count)
+        self.out_deg = numpy.bincount(self.sources, minlength=node_count)
+
+        log.info('Computing weighted degrees')
+        self.weighted_in_deg = self.in_deg / max(1, self.in_deg.max(initial=0))
+        self.weighted_out_deg = self.out_deg / max(1, self.out_deg.max(initial=0))
+
+        log.info('Randomizing node locations and colors')
+        place = _place_nodes if not legacy_placement else _legacy_place_nodes
+        self.x, self.y, self.color = place(web.nodes)
+
+        log.info('Done building node data')
+
+    @property
+    def deg(self):
+        return self.in_deg + self.out_deg
+
+    @property
+    def weighted_deg(self):
+        return numpy.maximum(self.weighted_in_deg, self.weighted_out_deg)
+
+    # the scores from analytics.py are only worked out when they're first used
+
+    @functools.cached_property
+    def _csr(self):
+        return nsndswap.analytics.csr(self.sources, self.targets, len(self.titles))
+
+    @functools.cached_property
+    def pagerank(self):
+        log.info('Computing PageRank')
+        return nsndswap.analytics.pagerank(*self._csr)
+
+    @functools.cached_property
+    def reverse_pagerank(self):
+        log.info('Computing reverse PageRank')
+        return nsndswap.analytics.pagerank(*nsndswap.analytics.transpose(*self._csr))
+
+    @functools.cached_property
+    def _hits(self):
+        log.info('Computing hub and authority scores')
+        return nsndswap.analytics.hits(*self._csr)
+
+    @property
+    def hub(self):
+        return self._hits[0]
+
+    @property
+    def authority(self):
+        return self._hits[1]
+
+    @functools.cached_property
+    def components(self):
+        # (component of each node, number of components), as
+        # analytics.strongly_connected_components numbers them; two songs
+        # share a component when each leads back to the other
+        log.info('Finding strongly connected components')
+        return nsndswap.analytics.strongly_connected_components(*self._csr)
+
+    @property
+    def component(self):
+        return self.components[0]
+
+    @property
+    def component_size(self):
+        component, component_count = self.components
+        return numpy.bincount(component, minlength=component_count)[component]
+
+    def shortest_cycle(self, node):
+        # node ids of a shortest loop of references from node back to itself,
+        # or None if it isn't in one
+        return nsndswap.analytics.shortest_cycle(*self._csr, self.component, node)
+
+    @functools.cached_property
+    def _transitive_counts(self):
+        log.info('Counting transitive references')
+        return nsndswap.analytics.transitive_counts(*self._csr, self.components)
+
+    @property
+    def transitive_out(self):
+        # how many songs each one references through any chain of references
+        return self._transitive_counts[0]
+
+    @property
+    def transitive_in(self):
+        # how many songs reference each one through any chain of references
+        return self._transitive_counts[1]
+
+    @functools.cached_property
+    def reachability(self):
+        # an analytics.ReachabilityIndex, for asking what leads to what
+        log.info('Building the reachability index')
+        return nsndswap.analytics.ReachabilityIndex(*self._csr, self.components)
+
+    def sizes(self, reverse_size=False, size_by='degree'):
+        # size_by is which of SIZE_METRICS the sizes come from
+        if size_by not in SIZE_METRICS:
+            raise ValueError(f'unknown size metric {size_by!r}')
+        if (size_by, reverse_size) not in self._sizes:
+            log.info('Computing sizes')
+            if size_by == 'degree':
+                size_deg = self.weighted_in_deg if not reverse_size else self.weighted_out_deg
+            else:
+                score = getattr(self, SIZE_METRICS[size_by][reverse_size])
+                size_deg = score / max(score.max(initial=0), numpy.finfo(float).tiny)
+            # don't ask me where this off-by-one comes from
+            self._sizes[size_by, reverse_size] = size_deg * SIZE_FACTOR + SIZE_OFFSET - 1
+        return self._sizes[size_by, reverse_size]
+
+    def lay_out(self, *, iterations=nsndswap.layout.FR_ITERATIONS, theta=nsndswap.layout.FR_THETA,
+                overlap_iterations=nsndswap.layout.NOVERLAP_ITERATIONS):
+        # Runs the force-directed layout over x and y, starting from where they
+        # are. Overlaps depend on the sizes, so they're removed separately for
+        # each direction, by positions.
+        log.info('Laying out %s nodes', len(self.titles))
+        self.x, self.y = nsndswap.layout.fruchterman_reingold(self.x, self.y, self.sources, self.targets,
+                                                              iterations=iterations, theta=theta)
+        self._overlap_iterations = overlap_iterations
+        self._positions = {}
+        log.info('Done laying out nodes')
+
+    def warm_start(self, positions):
+        # Starts from an earlier layout, given as {title: (x, y)}. Titles that
+        # aren't in it are placed near the nodes they're connected to.
+        known = numpy.zeros(len(self.titles), dtype=bool)
+        for i, title in enumerate(self.titles):
+            if title in positions:
+                self.x[i], self.y[i] = positions[title]
+                known[i] = True
+        log.info('Starting from an earlier layout, which has %s of %s nodes', known.sum(), len(known))
+        self.x, self.y = nsndswap.layout.place_near_neighbours(self.x, self.y, known, self.sources, self.targets)
+        self._positions = {}
+
+    def positions(self, reverse_size=False, size_by='degree'):
+        # x and y, with overlaps removed if the layout has been run
+        if self._overlap_iterations == 0:
+            return self.x, self.y
+        if (size_by, reverse_size) not in self._positions:
+            log.info('Removing overlaps')
+            self._positions[size_by, reverse_size] = nsndswap.layout.remove_overlaps(
+                self.x, self.y, self.sizes(reverse_size, size_by), iterations=self._overlap_iterations)
+        return self._positions[size_by, reverse_size]
+
+    def view(self, reverse_size=False, size_by='degree'):
+        return [NodeSnapshot(self, i, reverse_size, size_by) for i in range(len(self.titles))]
+
+
 class Web:
     def __init__(self):
         self.nodes = []  # list of strings
-        self.edges = []  # list of edges, as (from, to) tuples
-        self._nodes_discovered_via_entries = []  # list of node indexes that we've seen the reflists for
+        self._edges = {}  # (from, to) tuples -> None, in insertion order (the order gives the edge ids)
+        self._out_edges = {}  # from -> {to: None}, in insertion order
+        self._in_edges = {}  # to -> {from: None}, in insertion order
+        self._nodes_discovered_via_entries = {}  # node indexes that we've seen the reflists for -> None
+        self._node_ids = {}  # title -> index into self.nodes
+        self._snapshot = None  # cached WebSnapshot, dropped whenever the web changes
+
+    @property
+    def edges(self):
+        # list of edges, as (from, to) tuples
+        return list(self._edges)
+
+    def __getstate__(self):
+        # the indexes are derived data, so keep pickles in the same shape as before they existed
+        return {
+            'nodes': self.nodes,
+            'edges': list(self._edges),
+            '_nodes_discovered_via_entries': list(self._nodes_discovered_via_entries),
+        }
+
+    def __setstate__(self, state):
+        self.nodes = state['nodes']
+        self._nodes_discovered_via_entries = dict.fromkeys(state['_nodes_discovered_via_entries'])
+        self._node_ids = {title: i for i, title in enumerate(self.nodes)}
+        self._snapshot = None
+        self._edges = {}
+        self._out_edges = {}
+        self._in_edges = {}
+        for edge in state['edges']:
+            self._add_edge(edge)
 
     def _get_id_of(self, title):
         try:
-            return self.nodes.index(title)
-        except ValueError:
-            print(f'Discovered a new song, "{title}"')
+            return self._node_ids[title]
+        except KeyError:
+            log.debug('Discovered a new song, "%s"', title)
             self.nodes.append(title)
             r = len(self.nodes) - 1
             assert self.nodes[r] is title
+            self._node_ids[title] = r
+            self._snapshot = None
             return r
 
-    def append(self, nsnd, *, override_on_duplicate=[], skip_on_duplicate=[]):
-        duplicates_shared = set(override_on_duplicate) & set(skip_on_duplicate)
+    def _add_edge(self, edge):
+        self._snapshot = None
+        self._edges[edge] = None
+        self._out_edges.setdefault(edge[0], {})[edge[1]] = None
+        self._in_edges.setdefault(edge[1], {})[edge[0]] = None
+
+    def _drop_edges_from(self, node_id):
+        self._snapshot = None
+        for target in self._out_edges.pop(node_id, ()):
+            del self._edges[(node_id, target)]
+            del self._in_edges[target][node_id]
+
+    @staticmethod
+    def _duplicate_lists(override_on_duplicate, skip_on_duplicate):
+        override_on_duplicate = set(override_on_duplicate)
+        skip_on_duplicate = set(skip_on_duplicate)
+        duplicates_shared = override_on_duplicate & skip_on_duplicate
         if len(duplicates_shared) > 0:
-            print('override_on_duplicate and skip_on_duplicate share entries, aborting!')
-            print('The duplicate entries are:')
-            print(', '.join(duplicates_shared))
+            log.error('override_on_duplicate and skip_on_duplicate share entries, aborting!')
+            log.error('The duplicate entries are:')
+            log.error(', '.join(duplicates_shared))
             raise SystemExit(2)
+        return override_on_duplicate, skip_on_duplicate
+
+    def _add_entry(self, title, override_on_duplicate, skip_on_duplicate):
+        # returns the id of the song whose references come next, or None to skip them
+        node_id = self._get_id_of(title)
+        if node_id in self._nodes_discovered_via_entries:
+            if title in override_on_duplicate:
+                log.warning('Overriding "%s" on duplicate', title)
+                self._drop_edges_from(node_id)
+            elif title in skip_on_duplicate:
+                log.warning('Skipping "%s" on duplicate', title)
+                return None
+            else:
+                log.error('Illegal duplicated song, stopping')
+                raise SystemExit(2)
+        else:
+            self._nodes_discovered_via_entries[node_id] = None
+        return node_id
+
+    def append(self, nsnd, *, override_on_duplicate=[], skip_on_duplicate=[]):
+        override_on_duplicate, skip_on_duplicate = self._duplicate_lists(override_on_duplicate, skip_on_duplicate)
         for next_song in nsnd:
             assert isinstance(next_song, nsndswap.util.Track)
             if next_song.title == "":
-                print('Skipping a null song')
+                log.debug('Skipping a null song')
+                continue
+            log.debug('Turning references into map for "%s"', next_song.title)
+
+            node_id = self._add_entry(next_song.title, override_on_duplicate, skip_on_duplicate)
+            if node_id is None:
                 continue
-            print(f'Turning references into map for "{next_song.title}"')
-
-            node_id = self._get_id_of(next_song.title)
-            if node_id in self._nodes_discovered_via_entries:
-                if next_song.title in override_on_duplicate:
-                    print(f'[W] Overriding "{next_song.title}" on duplicate')
-                    self.edges = [x for x in self.edges if x[0] != node_id]
-                elif next_song.title in skip_on_duplicate:
-                    print(f'[W] Skipping "{next_song.title}" on duplicate')
-                    continue
-                else:
-                    print('Illegal duplicated song, stopping')
-                    raise SystemExit(2)
-            else:
-                self._nodes_discovered_via_entries.append(node_id)
 
             # document references
             for ref in next_song.references:
                 if ref.lower() in ("", "n/a"):
-                    print('Skipping a null reference')
+                    log.debug('Skipping a null reference')
                     continue
                 ref_node_id = self._get_id_of(ref)
                 if ref_node_id == node_id:
-                    print(f'Skipping a reference from "{next_song.title}" to itself')
+                    log.debug('Skipping a reference from "%s" to itself', next_song.title)
                     continue
                 edge = (node_id, ref_node_id)
-                if edge in self.edges:
-                    print(f'Skipping a duplicated reference from "{next_song.title}" to "{ref}"')
+                if edge in self._edges:
+                    log.debug('Skipping a duplicated reference from "%s" to "%s"', next_song.title, ref)
                     continue
-                self.edges += [edge]
-                print(f'Followed a reference from "{next_song.title}" to "{ref}"')
-
-    def make_snapshot(self, reverse_size=False):
-        snapshot = [NodeSnapshot() for _ in self.nodes]
-
-        print('Adding basics to snapshot')
-        for i in range(len(self.nodes)):
-            snapshot[i].index = i
-            snapshot[i].name = self.nodes[i]
-
-        print('Adding degrees to snapshot')
-        for ref in self.edges:
-            snapshot[ref[0]].out_deg += 1
-            snapshot[ref[1]].in_deg += 1
-
-        print('Computing largest degree (for weighted degrees)')
-        largest_in = 1
-        largest_out = 1
-        for data in snapshot:
-            largest_in = max(largest_in, data.in_deg)
-            largest_out = max(largest_out, data.out_deg)
-
-        print('Computing weighted degrees, sizes')
-        for data in snapshot:
-            data.weighted_in_deg = data.in_deg / largest_in
-            data.weighted_out_deg = data.out_deg / largest_out
-            size_deg = data.weighted_in_deg if not reverse_size else data.weighted_out_deg
-            # don't ask me where this off-by-one comes from
-            data.size = size_deg * SIZE_FACTOR + SIZE_OFFSET - 1
-
-        print('Randomizing node locations and colors')
-
-        def make_component(r):
-            return min(max(r.gauss(0, BOX_SIDE_STDDEV), -BOX_SIDE_STDDEV * BOX_SIDE_MAXDEV),
-                       BOX_SIDE_STDDEV * BOX_SIDE_MAXDEV)
-
-        for i in range(len(snapshot)):
-            r = random.Random()
-            r.seed(self.nodes[i])
-            snapshot[i].position = complex(make_component(r), make_component(r))
-            snapshot[i].color = tuple(round(x * 255) for x
-                in colorsys.hsv_to_rgb(r.random(), SATURATION, VALUE))
-
-        print('Done building node data')
-        return snapshot
-
-    def dump_gexf(self, outf, reverse_size=False):
+                self._add_edge(edge)
+                log.debug('Followed a reference from "%s" to "%s"', next_song.title, ref)
+
+    def merge(self, other, *, override_on_duplicate=[], skip_on_duplicate=[]):
+        # Adds everything in another web, with the same result as appending the
+        # tracks it was built from (provided it was built without overriding
+        # anything, since that forgets the tracks that were overridden). The
+        # titles are only looked up once each, and references that were already
+        # dropped or deduplicated while building other aren't looked at again.
+        override_on_duplicate, skip_on_duplicate = self._duplicate_lists(override_on_duplicate, skip_on_duplicate)
+        id_map = [None] * len(other.nodes)  # other's node ids -> ours, filled in as they're reached
+
+        def map_id(other_id):
+            node_id = id_map[other_id]
+            if node_id is None:
+                node_id = id_map[other_id] = self._get_id_of(other.nodes[other_id])
+            return node_id
+
+        for other_id in other._nodes_discovered_via_entries:
+            title = other.nodes[other_id]
+            log.debug('Merging references for "%s"', title)
+            node_id = self._add_entry(title, override_on_duplicate, skip_on_duplicate)
+            if node_id is None:
+                continue
+            id_map[other_id] = node_id
+            for other_ref_id in other._out_edges.get(other_id, ()):
+                edge = (node_id, map_id(other_ref_id))
+                if edge not in self._edges:
+                    self._add_edge(edge)
+
+    def snapshot(self, *, legacy_placement=None):
+        # The snapshot is cached until the next change to the web. It's only
+        # rebuilt for a legacy_placement other than the one it was built with;
+        # leaving that out takes it as it is, layout and all.
+        if self._snapshot is None or legacy_placement not in (None, self._snapshot.legacy_placement):
+            self._snapshot = WebSnapshot(self, legacy_placement=bool(legacy_placement))
+        return self._snapshot
+
+    def make_snapshot(self, reverse_size=False, *, legacy_placement=False, size_by='degree'):
+        return self.snapshot(legacy_placement=legacy_placement).view(reverse_size, size_by)
+
+    def dump_gexf(self, outf, reverse_size=False, *, legacy_placement=False, size_by='degree'):
         reverse_str = 'reversed ' if reverse_size else ''
-        snapshot = self.make_snapshot(reverse_size=reverse_size)
-        print(f'Dumping {reverse_str}web')
-        outf.write(f"""<?xml version="1.0" encoding="UTF-8" ?>
-<gexf xmlns="http://www.gexf.net/1.3" version="1.3" xmlns:viz="http://www.gexf.net/1.3/viz">
-    <meta lastmodifieddate="{str(datetime.date.today())}">
-        <creator>nsndswap</creator>
-        <description>This is a list of references (remixes, arrangements, samples, etc.) in Homestuck music.</description>
-    </meta>
-    <graph mode="static" defaultedgetype="directed">
-        <nodes>""")
-        for node_id in range(len(self.nodes)):
-            outf.write(f"""
-            <node id=\"{node_id}\" label=\"{_xmlencode(self.nodes[node_id])}\">
-                <viz:size value="{snapshot[node_id].size}"></viz:size>
-                <viz:position x="{snapshot[node_id].position.real}" y="{snapshot[node_id].position.imag}"></viz:position>
-                <viz:color r="{snapshot[node_id].color[0]}" g="{snapshot[node_id].color[1]}" b="{snapshot[node_id].color[2]}"></viz:color>
-            </node>""")
-        outf.write("""
-        </nodes>
-        <edges>""")
-        for edge_id in range(len(self.edges)):
-            edge = self.edges[edge_id]
-            if reverse_size:
-                edge = edge[1], edge[0]
-            outf.write(f"""
-            <edge id="{edge_id}" source="{edge[0]}" target="{edge[1]}">
-                <viz:color r="192" g="192" b="192"></viz:color>
-            </edge>""")
-        outf.write("""
-        </edges>
-    </graph>
-</gexf>\n""")
-        print('Done dumping web')
+        snapshot = self.snapshot(legacy_placement=legacy_placement)
+        sources, targets = snapshot.sources, snapshot.targets
+        if reverse_size:
+            sources, targets = targets, sources
+        log.info('Dumping %sweb', reverse_str)
+        x, y = snapshot.positions(reverse_size, size_by)
+        nsndswap.gexf.GexfWriter(outf).write_graph(
+            self.nodes, snapshot.sizes(reverse_size, size_by).tolist(), x.tolist(), y.tolist(),
+            snapshot.color.tolist(), sources.tolist(), targets.tolist(),
+            [(title, kind, getattr(snapshot, field).tolist()) for title, kind, field in GEXF_ATTRIBUTES])
+        log.info('Done dumping web')
+
+    def transitive_references(self, title):
+        # every song that title references through some chain of references
+        reachability = self.snapshot().reachability
+        return [self.nodes[x] for x in reachability.reachable(self._node_ids[title]).tolist()]
+
+    def transitively_referenced_by(self, title):
+        # every song with some chain of references leading to title
+        reachability = self.snapshot().reachability
+        return [self.nodes[x] for x in reachability.reaching(self._node_ids[title]).tolist()]
+
+    def dump_lineage(self, outf):
+        # Each song, how many songs ultimately derive from it, and the ones
+        # that reference it directly, with how many derive from each of those
+        # in turn. Spelling out every derived song for every song would take
+        # space for each pair of them, which is most pairs once there's a big
+        # loop; transitively_referenced_by gives the whole list for one song.
+        log.info('Dumping lineage')
+        derived_counts = self.snapshot().transitive_in.tolist()
+        for node_i in range(len(self.nodes)):
+            if derived_counts[node_i]:
+                outf.write(f'{self.nodes[node_i]} ({derived_counts[node_i]}):' + '\n  - '.join(
+                    [''] + [f'{self.nodes[x]} ({derived_counts[x]})' for x in self._in_edges.get(node_i, ())]) + '\n')
+        log.info('Done dumping lineage')
+
+    def dump_cycles(self, outf):
+        # every group of songs that reference each other in a loop, biggest
+        # first, with one of the shortest loops through its first song
+        log.info('Dumping cycles')
+        snapshot = self.snapshot()
+        component = snapshot.component
+        members = {}  # component -> its node ids
+        for node_i, c in enumerate(component.tolist()):
+            members.setdefault(c, []).append(node_i)
+        loops = sorted((nodes for nodes in members.values() if len(nodes) > 1), key=lambda nodes: -len(nodes))
+        log.info('Found %s cycles, covering %s songs', len(loops), sum(len(nodes) for nodes in loops))
+        for number, nodes in enumerate(loops, 1):
+            cycle = snapshot.shortest_cycle(nodes[0])
+            outf.write(f'Cycle {number} ({len(nodes)} songs):' + '\n  - '.join([''] + [self.nodes[x] for x in nodes]) +
+                       '\n  ' + ' -> '.join(self.nodes[x] for x in cycle + cycle[:1]) + '\n')
+        log.info('Done dumping cycles')
 
     def dump_titles(self, outf):
-        print('Dumping titles')
+        log.info('Dumping titles')
         for title in self.nodes:
             outf.write(title + '\n')
-        print('Done dumping titles')
+        log.info('Done dumping titles')
 
     def dump_unknown_references(self, outf):
-        print('Dumping unknown references')
+        log.info('Dumping unknown references')
         unknownrefs = set(self.nodes) - set(self.nodes[x] for x in self._nodes_discovered_via_entries)
         for title in unknownrefs:
             outf.write(title + '\n')
-        print('Done dumping unknown references')
+        log.info('Done dumping unknown references')
+
+    def dump_suggestions(self, outf):
+        # each unknown reference, with the known titles it's closest to, in
+        # case it's a misspelling of one of them
+        log.info('Dumping suggestions')
+        index = nsndswap.fuzzy.TrigramIndex(self.nodes[x] for x in self._nodes_discovered_via_entries)
+        for node_i, title in enumerate(self.nodes):
+            if node_i in self._nodes_discovered_via_entries:
+                continue
+            suggestions = index.nearest(title)
+            if suggestions:
+                outf.write(f'{title}:' + '\n  - '.join(
+                    [''] + [f'{known} ({distance} edits)' for known, distance in suggestions]) + '\n')
+        log.info('Done dumping suggestions')
 
     def dump_plaintext(self, outf, reverse=False):
         reverse_str = 'reversed ' if reverse else ''
-        print(f'Dumping {reverse_str}plaintext')
+        log.info('Dumping %splaintext', reverse_str)
+        adjacency = self._out_edges if not reverse else self._in_edges
         for node_i in range(len(self.nodes)):
-            references = []
-            for ref in self.edges:
-                if ref[0 if not reverse else 1] == node_i:
-                    references.append(self.nodes[ref[1 if not reverse else 0]])
+            references = [self.nodes[x] for x in adjacency.get(node_i, ())]
             if references:
                 outf.write(f'{self.nodes[node_i]}:' + '\n  - '.join([''] + references).rstrip() + '\n')
             elif node_i in self._nodes_discovered_via_entries:
                 outf.write(f'{self.nodes[node_i]}: none.\n')
-        print(f'Done dumping {reverse_str}plaintext')
+        log.info('Done dumping %splaintext', reverse_str)
 
     def dump_unicode_titles(self, outf):
-        print('Dumping unicode titles')
+        log.info('Dumping unicode titles')
         for node in self.nodes:
             if node != node.encode('ascii', 'ignore').decode('ascii'):
                 outf.write(f'{node}\n')
-        print('Done dumping unicode titles')
+        log.info('Done dumping unicode titles')
+
+    def dump_binary(self, outf):
+        log.info('Dumping binary web')
+        nsndswap.binary.write_web(outf, self.nodes, list(self._edges), self._nodes_discovered_via_entries)
+        log.info('Done dumping binary web')
+
+    @classmethod
+    def load_binary(cls, inf):
+        graph = nsndswap.binary.BinaryWeb.open(inf)
+        sources, targets = graph.edge_arrays()
+        web = cls.__new__(cls)
+        web.__setstate__({
+            'nodes': graph.titles(),
+            'edges': list(zip(sources.tolist(), targets.tolist())),
+            '_nodes_discovered_via_entries': graph.discovered.tolist(),
+        })
+        return web
 
     def dump_pickle(self, outf):
         from pickle import dump
-        print('Pickling the web')
+        log.info('Pickling the web')
         dump(self, outf)
-        print('Done pickling')
+        log.info('Done pickling')
@@ -2,18 +2,22 @@
 
 set -eu
 if [[ -d output ]]; then
-    echo Erasing output directory
-    rm -r output
+    echo Keeping the last output in output.previous
+    rm -rf output.previous
+    mv output output.previous
 fi
 mkdir output
 
-echo Starting Python script
-.env/bin/python3 -m nsndswap
+if [[ -n "${GEPHI:-}" ]]; then
+    echo Starting Python script
+    .env/bin/python3 -m nsndswap
 
-cd gephibridge
-export CLASSPATH='.:lib/*'
-javac GephiBridge.java
-for f in ../output/*.gexf ; do
-    java GephiBridge "$f" &
-done
-wait
+    echo Laying out with Gephi
+    cd gephibridge
+    export CLASSPATH='.:lib/*'
+    javac GephiBridge.java
+    java GephiBridge ../output/*.gexf
+else
+    echo Starting Python script
+    .env/bin/python3 -m nsndswap --layout --warm-start output.previous
+fi
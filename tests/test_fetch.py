@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+# tests/test_fetch.py
+# copyright 2017 ViKomprenas, 2-clause BSD license (LICENSE.md)
+
+# Fetching against a local http.server: retries, timeouts, and pages being
+# parsed while the others are still arriving. Run from the top of the repo
+# with python3 -m unittest discover -s tests (or python3 -m pytest).
+
+import http.server
+import itertools
+import threading
+import time
+import types
+import unittest
+import unittest.mock
+import requests
+import nsndswap.__main__
+import nsndswap.fetch
+import nsndswap.makin_nsnd
+
+WAIT = 10  # seconds to wait for anything that should happen straight away
+
+
+class Handler(http.server.BaseHTTPRequestHandler):
+    # GET /flaky: 503 twice, then the page
+    # GET /stall: nothing at all until the test is over
+    # GET /makin: the page, straight away
+    # GET /slow: the first part of the page, then the rest once the test says so
+    def do_GET(self):
+        server = self.server
+        if self.path == '/flaky':
+            server.flaky_hits += 1
+            if server.flaky_hits <= 2:
+                self._respond(503, b'try again later')
+                return
+            self._respond(200, b'<html><body>the page</body></html>')
+        elif self.path == '/stall':
+            server.release.wait(WAIT)
+        elif self.path == '/makin':
+            self._respond(200, b'<html><body></body></html>')
+        elif self.path == '/slow':
+            body = b'<html><body>' + b'x' * 64 + b'</body></html>'
+            self._start(200, len(body))
+            self.wfile.write(body[:32])
+            self.wfile.flush()
+            server.release.wait(WAIT)
+            self.wfile.write(body[32:])
+        else:
+            self._respond(404, b'')
+
+    def _start(self, status, length):
+        self.send_response(status)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(length))
+        self.end_headers()
+
+    def _respond(self, status, body):
+        self._start(status, len(body))
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FetchTest(unittest.TestCase):
+    def setUp(self):
+        self.server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        self.server.flaky_hits = 0
+        self.server.release = threading.Event()
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.addCleanup(self.server.release.set)
+
+    def url(self, path):
+        return f'http://127.0.0.1:{self.server.server_port}{path}'
+
+    def test_retries_server_errors(self):
+        with unittest.mock.patch.object(nsndswap.fetch, 'FETCH_BACKOFF', 0):
+            session = nsndswap.fetch.make_session()
+        self.assertEqual(nsndswap.fetch.get_nsnd_page(self.url('/flaky'), session),
+                         '<html><body>the page</body></html>')
+        self.assertEqual(self.server.flaky_hits, 3)
+
+    def test_gives_up_after_timeout(self):
+        with unittest.mock.patch.object(nsndswap.fetch, 'FETCH_RETRIES', 0):
+            session = nsndswap.fetch.make_session()
+        start = time.monotonic()
+        with unittest.mock.patch.object(nsndswap.fetch, 'FETCH_TIMEOUT', (WAIT, 0.5)):
+            with self.assertRaises(requests.exceptions.RequestException):
+                nsndswap.fetch.get_nsnd_page(self.url('/stall'), session)
+        self.assertLess(time.monotonic() - start, WAIT / 2)
+
+    def test_parses_while_other_pages_arrive(self):
+        # makin's page is parsed all the way through while the slow page is
+        # stuck halfway, and the slow page's parser already has its first part
+        slow_started = threading.Event()
+
+        def parse_slow(chunks):
+            chunks = iter(chunks)
+            first = next(chunks)
+            slow_started.set()
+            return nsndswap.makin_nsnd.parse_stream(itertools.chain([first], chunks))
+        makin = types.ModuleType('nsndswap.makin_nsnd')
+        makin.parse_stream = nsndswap.makin_nsnd.parse_stream
+        slow = types.ModuleType('nsndswap.cookie_nsnd')
+        slow.parse_stream = parse_slow
+
+        with unittest.mock.patch.object(nsndswap.fetch, 'CHUNK_SIZE', 16):
+            # the slow page goes first, so it would hold makin's up if they took turns
+            nsnds = nsndswap.__main__.load_nsnd_pages({self.url('/slow'): slow, self.url('/makin'): makin})
+            self.assertEqual(nsnds[self.url('/makin')].result(WAIT), [])
+            self.assertTrue(slow_started.wait(WAIT))
+            self.assertFalse(nsnds[self.url('/slow')].done())
+            self.server.release.set()
+            self.assertEqual(nsnds[self.url('/slow')].result(WAIT), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
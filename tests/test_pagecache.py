@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+# tests/test_pagecache.py
+# copyright 2017 ViKomprenas, 2-clause BSD license (LICENSE.md)
+
+import os
+import tempfile
+import unittest
+import nsndswap.pagecache
+
+URL = 'http://127.0.0.1/nsnd'
+
+
+class PageCacheTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        self.cache = nsndswap.pagecache.PageCache(self.directory)
+        list(self.cache.store_chunks(URL, ['old ', 'page'], {'ETag': '"old"'}))
+
+    def test_replaces_page(self):
+        self.assertEqual(list(self.cache.store_chunks(URL, ['new ', 'page'], {'ETag': '"new"'})), ['new ', 'page'])
+        self.assertEqual(self.cache.load(URL), 'new page')
+        self.assertEqual(self.cache.conditional_headers(URL), {'If-None-Match': '"new"'})
+        self.assertEqual(len(os.listdir(self.directory)), 2)
+
+    def test_keeps_old_page_when_download_fails(self):
+        def chunks():
+            yield 'new '
+            raise TimeoutError
+        with self.assertRaises(TimeoutError):
+            list(self.cache.store_chunks(URL, chunks(), {'ETag': '"new"'}))
+        self.assertEqual(self.cache.load(URL), 'old page')
+        self.assertEqual(self.cache.conditional_headers(URL), {'If-None-Match': '"old"'})
+        self.assertEqual(len(os.listdir(self.directory)), 2)
+
+    def test_keeps_old_page_when_new_one_is_blank(self):
+        list(self.cache.store_chunks(URL, [''], {'ETag': '"new"'}))
+        self.assertEqual(self.cache.load(URL), 'old page')
+        self.assertEqual(len(os.listdir(self.directory)), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()